@@ -0,0 +1,212 @@
+"""
+Concatenation, splitting and substrings of SLPs without decompression,
+in the style of Rytter's AVL grammars.
+
+Heights are measured on the binary view of the grammar (SLP.height): a run
+rule b^k is seen as a balanced tree of k copies of b (height
+h(b) + ceil(log2 k)) and rc(b) has the height of b. Heights and lengths are
+memoized on the SLP, so an operation only looks at the nodes along its
+paths. join creates O(|h(X) - h(Y)| + 1) rules and keeps the AVL property
+(sibling heights differ by at most 1) of the rules it creates; split and
+substring create O(h^2) rules in the worst case, O(h) for AVL inputs. If
+the inputs are AVL (e.g. built only with these operations from a balanced
+grammar), the results have O(log n) height, with no balancing pass
+afterwards. The operations are iterative and work on any SLP, but only AVL
+inputs keep the height bound.
+"""
+
+
+def run(G, base, count): # nonterminal deriving base^count (base itself for count == 1)
+    if count == 1: return base
+    return G.new_nonterminal_run(base, count)
+
+
+def view(G, nt):
+    """
+    Returns (left, right) with Exp(nt) = Exp(left) Exp(right), both of height
+    smaller than nt: the rule itself for binary rules, halves for run rules,
+    reverse complements of the swapped children for rc rules.
+    """
+    rc = False
+    a, b = G.rules[nt]
+    while a is None: # rc(rc(x)) = x
+        rc = not rc
+        a, b = G.rules[b]
+    if a == 0:
+        raise ValueError("Terminals have no children")
+    if a > 0: # binary
+        left, right = a, b
+    else: # run
+        left, right = run(G, b, (-a + 1) // 2), run(G, b, -a // 2)
+    if rc: # rc(p q) = rc(q) rc(p)
+        return G.reverse_complement(right), G.reverse_complement(left)
+    return left, right
+
+
+def node(G, left, right): # new binary rule with its height recorded
+    nt = G.new_nonterminal_binary(left, right)
+    G.heights[nt] = max(G.height(left), G.height(right)) + 1
+    return nt
+
+
+def rebalance_left(G, A, Z):
+    # node deriving Exp(A) Exp(Z), where Z is at most 2 taller than A (AVL rotations)
+    if G.height(Z) <= G.height(A) + 1:
+        return node(G, A, Z)
+    Z1, Z2 = view(G, Z)
+    if G.height(Z1) <= G.height(Z2): # single rotation
+        return node(G, node(G, A, Z1), Z2)
+    Z11, Z12 = view(G, Z1) # double rotation
+    return node(G, node(G, A, Z11), node(G, Z12, Z2))
+
+
+def rebalance_right(G, Z, B):
+    # node deriving Exp(Z) Exp(B), where Z is at most 2 taller than B
+    if G.height(Z) <= G.height(B) + 1:
+        return node(G, Z, B)
+    Z1, Z2 = view(G, Z)
+    if G.height(Z2) <= G.height(Z1): # single rotation
+        return node(G, Z1, node(G, Z2, B))
+    Z21, Z22 = view(G, Z2) # double rotation
+    return node(G, node(G, Z1, Z21), node(G, Z22, B))
+
+
+def join(G, X, Y):
+    """
+    Returns a nonterminal deriving Exp(X) Exp(Y) (0 stands for the empty word).
+    The taller tree is descended along its inner spine down to the height of
+    the other one, and the new rules are rebalanced with AVL rotations on the
+    way back up.
+    """
+    if X == 0: return Y
+    if Y == 0: return X
+    path = [] # (True, A): X was A B, B was joined with Y; (False, B): Y was A B, X was joined with A
+    while abs(G.height(X) - G.height(Y)) > 1:
+        if G.height(X) > G.height(Y):
+            A, X = view(G, X)
+            path.append((True, A))
+        else:
+            Y, B = view(G, Y)
+            path.append((False, B))
+    Z = node(G, X, Y)
+    for left, sibling in reversed(path):
+        Z = rebalance_left(G, sibling, Z) if left else rebalance_right(G, Z, sibling)
+    return Z
+
+
+def split_nonterminal(G, X, i):
+    """
+    Returns (L, R) with Exp(L) = Exp(X)[:i] and Exp(R) = Exp(X)[i:]. The path
+    to position i is recorded on the way down and the pieces hanging off it
+    are joined on the way back up.
+    """
+    path = [] # None: the pair is reverse complemented; (P, Q): L = join(P, L), R = join(R, Q)
+    while True:
+        n = G.length(X)
+        if i == 0:
+            L, R = 0, X
+            break
+        if i == n:
+            L, R = X, 0
+            break
+        a, b = G.rules[X]
+        if a is None: # rc(b)[:i] = rc(b[n - i:])
+            path.append(None)
+            X, i = b, n - i
+        elif a < 0: # run: b^q (b[:r] | b[r:]) b^(k - q - 1)
+            q, r = divmod(i, G.length(b))
+            if r == 0:
+                L, R = run(G, b, q), run(G, b, -a - q)
+                break
+            path.append((run(G, b, q) if q > 0 else 0, run(G, b, -a - q - 1) if -a - q - 1 > 0 else 0))
+            X, i = b, r
+        else:
+            la = G.length(a)
+            if i == la:
+                L, R = a, b
+                break
+            if i < la:
+                path.append((0, b))
+                X = a
+            else:
+                path.append((a, 0))
+                X, i = b, i - la
+    for step in reversed(path):
+        if step is None:
+            L, R = G.reverse_complement(R) if R else 0, G.reverse_complement(L) if L else 0
+        else:
+            L, R = join(G, step[0], L), join(G, R, step[1])
+    return L, R
+
+
+def root_of(G, nt):
+    if nt is None:
+        if G.start == 0:
+            raise IndexError("Invalid start symbol")
+        nt = G.start
+    return nt
+
+
+def split(G, i, nt=None):
+    """
+    Returns nonterminals (L, R) of G deriving the prefix of length i and the
+    rest of Exp(nt) (default: the start); 0 stands for an empty part.
+    """
+    nt = root_of(G, nt)
+    if i < 0 or i > G.length(nt):
+        raise IndexError("Index out of range")
+    return split_nonterminal(G, nt, i)
+
+
+def substring(G, begin, end, nt=None):
+    """
+    Returns a nonterminal of G deriving Exp(nt)[begin:end] (0 if empty).
+    """
+    nt = root_of(G, nt)
+    if begin < 0 or end > G.length(nt) or begin > end:
+        raise IndexError("Range out of bounds")
+    L, _ = split_nonterminal(G, nt, end)
+    if L == 0: return 0
+    _, R = split_nonterminal(G, L, begin)
+    return R
+
+
+def import_grammar(G, H, nt=None):
+    """
+    Copies the rules of H reachable from nt (default: its start) into G and
+    returns the nonterminal of G deriving Exp(nt). Preterminals are shared.
+    """
+    nt = root_of(H, nt)
+    new_id = {}
+    stack = [nt]
+    while stack:
+        u = stack[-1]
+        if u in new_id:
+            stack.pop()
+            continue
+        a, b = H.rules[u]
+        kids = [] if a == 0 else ([a, b] if a is not None and a > 0 else [b])
+        missing = [x for x in kids if x not in new_id]
+        if missing:
+            stack.extend(reversed(missing))
+            continue
+        stack.pop()
+        if a == 0: # terminal
+            new_id[u] = G.get_preterminal(b)
+        elif a is None: # reverse complement
+            new_id[u] = G.reverse_complement(new_id[b])
+        elif a > 0: # binary
+            new_id[u] = G.new_nonterminal_binary(new_id[a], new_id[b])
+        else: # run
+            new_id[u] = G.new_nonterminal_run(new_id[b], -a)
+    return new_id[nt]
+
+
+def concat(G1, G2):
+    """
+    Appends Exp(G2) to G1 in place: the rules of G2 are copied into G1 (unless
+    G2 is G1) and the new start is the AVL join of both starts. Returns G1.
+    """
+    Y = G2.start if G2 is G1 else (import_grammar(G1, G2) if G2.start != 0 else 0)
+    G1.start = join(G1, G1.start, Y)
+    return G1
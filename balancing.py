@@ -1,4 +1,4 @@
-from slp import SLP
+from slp import SLP, COMPLEMENT
 from repair import compress_repair
 from tests import repair_adversary
 
@@ -162,7 +162,83 @@ def balance_path(G, P, L, R):
             G.set_rule_binary(P[i], X, R_suff[i])
 
 
-def balance(G):
+def expand_reverse_complements(G):
+    """
+    Replaces reverse-complement rules by explicit mirrored rules:
+    rc(X) -> rc(B) rc(A) for X -> A B, rc(X) -> rc(Y)^k for X -> Y^k and
+    rc(c) -> complement of c for terminals; this at most doubles the grammar.
+    The nonterminals reachable from the start (and the roots) are renumbered
+    so that children precede their parents and the start is the last one.
+    Modifies G in place.
+    """
+    new_id = {} # (nt, rc) -> id in the new grammar
+    rules = [(0, '?')]
+    preterminal = {}
+
+    def expand(root):
+        stack = [(root, False)]
+        while stack:
+            u, rc = stack[-1]
+            if (u, rc) in new_id:
+                stack.pop()
+                continue
+            a, b = G.rules[u]
+            if a is None: # rc(rc(b)) = b
+                child = (b, not rc)
+                if child not in new_id:
+                    stack.append(child)
+                    continue
+                new_id[(u, rc)] = new_id[child]
+            elif a == 0: # terminal
+                terminal = COMPLEMENT[b] if rc else b
+                if terminal not in preterminal:
+                    rules.append((0, terminal))
+                    preterminal[terminal] = len(rules) - 1
+                new_id[(u, rc)] = preterminal[terminal]
+            else:
+                kids = [(b, rc)] if a < 0 else ([(b, rc), (a, rc)] if rc else [(a, rc), (b, rc)])
+                missing = [x for x in kids if x not in new_id]
+                if missing:
+                    stack.extend(reversed(missing))
+                    continue
+                if a < 0: # run
+                    rules.append((a, new_id[kids[0]]))
+                else: # binary
+                    rules.append((new_id[kids[0]], new_id[kids[1]]))
+                new_id[(u, rc)] = len(rules) - 1
+            stack.pop()
+
+    for root in G.roots:
+        if root != 0: expand(root)
+    if G.start != 0: expand(G.start)
+
+    G.roots = [new_id[(root, False)] if root != 0 else 0 for root in G.roots]
+    G.start = new_id[(G.start, False)] if G.start != 0 else 0
+    G.rules = rules
+    G.lengths = [-1 for _ in rules]
+    G.heights = [-1 for _ in rules]
+    G.preterminal = preterminal
+    G.rc_of = {}
+    if G.interned is not None:
+        G.enable_interning()
+    return G
+
+
+def has_reverse_complements(G):
+    return any(a is None for a, b in G.rules)
+
+
+def prepare_for_balancing(G, intern):
+    # rc rules are expanded; ids are made topological with the start last (interning may reuse an old root)
+    if has_reverse_complements(G):
+        expand_reverse_complements(G)
+    elif G.start != len(G.rules) - 1:
+        G.compact()
+    if intern and G.interned is None:
+        G.enable_interning()
+
+
+def balance(G, intern=False):
     """
     Input: SLP G producing s of length |s| = n
     Output: Modifies G (in place), makes it O(log n) depth
@@ -171,8 +247,11 @@ def balance(G):
 
     * Assume that for all productions X -> A B we have A, B < X (on ids)
     * Assume that each nonterminal is reachable from the root
+    * Reverse-complement rules are expanded first (see expand_reverse_complements)
+    * With intern (or if G already interns rules), shortcuts with an existing right-hand side are reused
     
     """
+    prepare_for_balancing(G, intern)
     heavy_paths = get_heavy_paths(G)
     for P, L, R in heavy_paths:
         balance_path(G, P, L, R)
@@ -192,7 +271,8 @@ def get_longest_path(G, u=None):
         return [u] + Pb, [a] + Lb, [None] + Rb
 
 
-def balance_longest_path(G):
+def balance_longest_path(G, intern=False):
+    prepare_for_balancing(G, intern)
     P, L, R = get_longest_path(G)
     balance_path(G, P, L, R)
     return G
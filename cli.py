@@ -0,0 +1,210 @@
+"""
+Command-line tool:
+
+    python cli.py compress genome.fa genome.slp --compressor repair --balance heavy
+    python cli.py compress genome.fa genome.slp --memory-budget 512M   # external-memory RePair
+    python cli.py decompress genome.slp genome.fa --workers 8   # or --packed for 2-bit output
+    python cli.py access genome.slp positions.txt     # lines: "pos" or "doc pos"
+    python cli.py extract genome.slp ranges.txt       # lines: "begin end" or "doc begin end" (0-based, end excluded)
+    python cli.py stats genome.slp
+
+Compressors and balancing are imported only by the commands that need them,
+so queries on a stored grammar only load slp.py.
+"""
+import argparse
+import sys
+import time
+
+COMPRESSORS = ['repair', 'sequitur', 'recompression', 'recompression-greedy']
+
+
+def compress(text, compressor, reverse_complement, partition, intern):
+    if compressor == 'repair':
+        from repair import compress_repair
+        return compress_repair(text, reverse_complement=reverse_complement, intern=intern)
+    if compressor == 'sequitur':
+        from sequitur import compress_sequitur
+        return compress_sequitur(text, reverse_complement=reverse_complement, intern=intern)
+    if compressor == 'recompression':
+        from jez import compress_recompression
+        return compress_recompression(text, reverse_complement=reverse_complement, intern=intern)
+    from jez import compress_recompression_greedy
+    return compress_recompression_greedy(text, partition=partition, reverse_complement=reverse_complement, intern=intern)
+
+
+def load(path):
+    from slp import load_slp
+    with open(path) as f:
+        return load_slp(f)
+
+
+def documents(G): # roots of the documents stored in G
+    return G.roots if G.roots else [G.start]
+
+
+def print_stats(G, seconds=None, out=sys.stderr):
+    lengths = [G.length(root) if root != 0 else 0 for root in documents(G)]
+    depths = [G.depth(root) if root != 0 else 0 for root in documents(G)]
+    line = f'documents: {len(lengths)}    length: {sum(lengths)}    size: {G.size()}    depth: {max(depths, default=0)}'
+    if seconds is not None:
+        line += f'    time: {seconds:.3f}s'
+    print(line, file=out)
+
+
+def cmd_compress_external(args): # RePair with the working sequence and rules on disk
+    from repair_external import compress_repair_external, parse_size
+    from utils import stream_fasta
+    if args.compressor != 'repair' or args.reverse_complement or args.intern or args.balance is not None:
+        raise SystemExit('--memory-budget supports plain repair only (no --reverse-complement, --intern or --balance)')
+    names = []
+    t = time.perf_counter()
+    with open(args.input) as f, open(args.output, 'w') as out:
+        try:
+            res = compress_repair_external(stream_fasta(f, names), out, parse_size(args.memory_budget), args.workdir, names=names)
+        except ValueError as e:
+            raise SystemExit(str(e))
+    t = time.perf_counter() - t
+    if args.stats:
+        print(f'length: {res.length}    size: {len(res.terminals) + res.rules}    rounds: {res.rounds}    passes: {res.passes}    time: {t:.3f}s', file=sys.stderr)
+
+
+def cmd_compress(args):
+    if args.memory_budget is not None:
+        return cmd_compress_external(args)
+    from utils import read_fasta
+    from slp import save_slp
+    with open(args.input) as f:
+        records = read_fasta(f)
+    names = [name for name, _ in records]
+    t = time.perf_counter()
+    if len(records) == 1:
+        G = compress(records[0][1], args.compressor, args.reverse_complement, args.partition, args.intern)
+    else:
+        from collection import compress_collection
+        if args.compressor == 'recompression-greedy' and args.partition != 'sort':
+            raise SystemExit('--partition is not supported for multi-record inputs')
+        G = compress_collection([seq for _, seq in records], args.compressor, args.reverse_complement, args.intern)
+    if args.balance is not None:
+        if G.roots:
+            raise SystemExit('balancing is supported for single-record inputs only')
+        if any(a is not None and a < 0 for a, b in G.rules):
+            raise SystemExit('balancing is supported for grammars without run rules (repair, sequitur)')
+        from balancing import balance, balance_longest_path
+        if args.balance == 'heavy':
+            balance(G, args.intern)
+        else:
+            balance_longest_path(G, args.intern)
+    t = time.perf_counter() - t
+    with open(args.output, 'w') as f:
+        save_slp(G, f, names)
+    if args.stats:
+        print_stats(G, t)
+
+
+def cmd_decompress(args): # blocks of the documents are expanded into a mapped output file
+    from decompress import decompress
+    G, names = load(args.input)
+    try:
+        decompress(G, args.output, names, 'packed' if args.packed else 'fasta', args.width, args.workers)
+    except ValueError as e:
+        raise SystemExit(str(e))
+
+
+def read_queries(path, arity): # yields (doc, numbers...) from lines with arity or arity + 1 integers
+    with open(path) as f:
+        for line in f:
+            numbers = [int(x) for x in line.split()]
+            if not numbers: continue
+            if len(numbers) == arity:
+                yield (0, *numbers)
+            elif len(numbers) == arity + 1:
+                yield tuple(numbers)
+            else:
+                raise SystemExit(f'Invalid query line: {line.strip()}')
+
+
+def check_query(G, roots, doc, begin, end): # exits on queries outside the stored documents
+    if doc < 0 or doc >= len(roots):
+        raise SystemExit(f'Invalid document {doc} (the grammar has {len(roots)})')
+    n = G.length(roots[doc]) if roots[doc] != 0 else 0
+    if begin < 0 or end > n or begin > end:
+        raise SystemExit(f'Range [{begin}, {end}) out of bounds of document {doc} (length {n})')
+
+
+def cmd_access(args): # all positions of a document are answered in one traversal (access_many)
+    G, _ = load(args.input)
+    roots = documents(G)
+    queries = list(read_queries(args.queries, 1))
+    by_doc = {}
+    for k, (doc, index) in enumerate(queries):
+        check_query(G, roots, doc, index, index + 1)
+        by_doc.setdefault(doc, []).append(k)
+    res = [None] * len(queries)
+    for doc, ks in by_doc.items():
+        for k, terminal in zip(ks, G.access_many([queries[k][1] for k in ks], roots[doc])):
+            res[k] = terminal
+    sys.stdout.write(''.join(f'{terminal}\n' for terminal in res))
+
+
+def cmd_extract(args):
+    G, _ = load(args.input)
+    roots = documents(G)
+    out = sys.stdout
+    for doc, begin, end in read_queries(args.queries, 2):
+        check_query(G, roots, doc, begin, end)
+        out.write(''.join(map(str, G.extract(begin, end, roots[doc]))) + '\n')
+
+
+def cmd_stats(args):
+    G, _ = load(args.input)
+    print_stats(G, out=sys.stdout)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Grammar compression of DNA sequences.')
+    parser.add_argument('--recursion-limit', type=int, help='raise the Python recursion limit (balancing of deep grammars)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    p = commands.add_parser('compress', help='compress a FASTA file into a grammar')
+    p.add_argument('input')
+    p.add_argument('output')
+    p.add_argument('--compressor', choices=COMPRESSORS, default='repair')
+    p.add_argument('--partition', choices=['sort', 'counting', 'left-right'], default='sort', help='pair partition of recompression-greedy')
+    p.add_argument('--reverse-complement', action='store_true', help='share rules with reverse complements')
+    p.add_argument('--intern', action='store_true', help='reuse nonterminals for repeated right-hand sides')
+    p.add_argument('--balance', choices=['heavy', 'longest'], help='balance the grammar after compression')
+    p.add_argument('--stats', action='store_true', help='print size / depth / time to stderr')
+    p.add_argument('--memory-budget', help='external-memory repair within this many bytes of RAM (e.g. 512M); single-record inputs')
+    p.add_argument('--workdir', help='directory of the temporary files of --memory-budget (default: system temp)')
+    p.set_defaults(func=cmd_compress)
+
+    p = commands.add_parser('decompress', help='write the sequences of a grammar as FASTA')
+    p.add_argument('input')
+    p.add_argument('output')
+    p.add_argument('--width', type=int, default=60, help='FASTA line width')
+    p.add_argument('--workers', type=int, default=1, help='worker processes expanding blocks in parallel')
+    p.add_argument('--packed', action='store_true', help='write 2-bit packed ACGT instead of FASTA')
+    p.set_defaults(func=cmd_decompress)
+
+    p = commands.add_parser('access', help='terminals at the positions listed in a file')
+    p.add_argument('input')
+    p.add_argument('queries')
+    p.set_defaults(func=cmd_access)
+
+    p = commands.add_parser('extract', help='substrings for the ranges listed in a file')
+    p.add_argument('input')
+    p.add_argument('queries')
+    p.set_defaults(func=cmd_extract)
+
+    p = commands.add_parser('stats', help='length, size and depth of a grammar')
+    p.add_argument('input')
+    p.set_defaults(func=cmd_stats)
+
+    args = parser.parse_args(argv)
+    if args.recursion_limit is not None:
+        sys.setrecursionlimit(max(sys.getrecursionlimit(), args.recursion_limit))
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+from slp import SLP
+from repair import repair_sequences
+from sequitur import sequitur_sequences
+from jez import recompression_sequences, random_bits, GREEDY_PARTITIONS
+from utils import compress_texts
+
+COMPRESSORS = {
+    'repair': lambda slp, seqs, rc: repair_sequences(slp, seqs, rc),
+    'sequitur': lambda slp, seqs, rc: sequitur_sequences(slp, seqs, rc),
+    'recompression': lambda slp, seqs, rc: recompression_sequences(slp, seqs, random_bits(), rc),
+    'recompression-greedy': lambda slp, seqs, rc: recompression_sequences(slp, seqs, GREEDY_PARTITIONS['sort'], rc),
+}
+
+
+def compress_collection(texts, compressor='repair', reverse_complement=False, intern=False):
+    """
+    Compresses a collection of documents into one SLP with one root per
+    document: G.roots[d] derives exactly texts[d] (no separators are added,
+    nothing is derived across document boundaries), and all rules are shared
+    between the documents. G.start is 0, the documents are accessed by index.
+    With reverse_complement, rules are also shared with reverse complements.
+    """
+    if compressor not in COMPRESSORS:
+        raise ValueError(f'Unknown compressor {compressor}')
+    return compress_texts(SLP(intern), texts, COMPRESSORS[compressor], reverse_complement)
+
+
+def document_length(G, doc):
+    root = G.roots[doc]
+    return 0 if root == 0 else G.length(root)
+
+
+def document_access(G, doc, index): # terminal at position index of document doc
+    if index < 0 or index >= document_length(G, doc):
+        raise IndexError("Index out of range")
+    return G.access(index, G.roots[doc])
+
+
+def document_extract(G, doc, begin, end): # terminals at positions begin..end-1 of document doc
+    if begin < 0 or end > document_length(G, doc) or begin > end:
+        raise IndexError("Range out of bounds")
+    if begin == end: return []
+    return G.extract(begin, end, G.roots[doc])
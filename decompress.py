@@ -0,0 +1,167 @@
+"""
+Parallel decompression of a grammar into a memory-mapped output file.
+
+The layout of the whole file is known in advance from the lengths of the
+documents, so the root ranges are cut into blocks at fixed offsets and each
+block is expanded by a worker process straight into its part of the shared
+mmap. Blocks are aligned to whole FASTA lines (or whole bytes of the 2-bit
+packed format), so no two workers write to the same byte.
+
+Inside a worker, expansions of short nonterminals are cached as strings, so
+a repeated subtree is walked once per worker instead of once per occurrence.
+
+Packed format: a text line "2bit <documents> <length>..." followed by each
+document packed 4 bases per byte (A=0, C=1, G=2, T=3, first base in the
+high bits), every document starting at a new byte.
+"""
+import mmap
+from concurrent.futures import ProcessPoolExecutor
+
+from slp import COMPLEMENT
+
+PACKED_CODES = {'A': 0, 'C': 1, 'G': 2, 'T': 3}
+RC_TABLE = str.maketrans(COMPLEMENT)
+
+_grammar = None # grammar of a pool worker
+_output = None # (path, fmt, width) of the file written by a pool worker
+_cache = {} # nonterminal -> its expansion, for short nonterminals
+_cached = 0 # characters in _cache
+
+
+def _init_worker(G, path, fmt, width):
+    global _grammar, _output, _cached
+    _grammar, _output = G, (path, fmt, width)
+    _cache.clear()
+    _cached = 0
+
+
+def expand(G, nt, begin, end, cache_length=1 << 12, cache_budget=1 << 26):
+    """
+    Returns Exp(nt)[begin:end] as a string. The expansions of nonterminals
+    not longer than cache_length are cached (up to cache_budget characters).
+    """
+    global _cached
+    res = []
+    stack = [(nt, begin, end, False)] # (u, i, j, rc) as in SLP.extract
+    while stack:
+        u, i, j, rc = stack.pop()
+        if i >= j: continue
+        n = G.length(u)
+        if n <= cache_length:
+            s = _cache.get(u)
+            if s is None:
+                s = ''.join(G.extract(0, n, u))
+                if _cached + n <= cache_budget:
+                    _cache[u] = s
+                    _cached += n
+            res.append(s[n - j:n - i].translate(RC_TABLE)[::-1] if rc else s[i:j])
+            continue
+        a, b = G.rules[u]
+        if a is None: # reverse complement
+            stack.append((b, i, j, not rc))
+        elif a > 0: # binary; rc(a b) = rc(b) rc(a)
+            if rc: a, b = b, a
+            la = G.length(a)
+            if j > la: stack.append((b, max(i - la, 0), j - la, rc))
+            if i < la: stack.append((a, i, min(j, la), rc))
+        else: # run; rc(b^k) = rc(b)^k
+            lb = G.length(b)
+            for k in reversed(range(i // lb, (j - 1) // lb + 1)):
+                stack.append((b, max(i - k * lb, 0), min(j - k * lb, lb), rc))
+    return ''.join(res)
+
+
+def pack(s): # 2-bit codes of s, 4 per byte, the last byte padded with A (0)
+    codes = [PACKED_CODES[c] for c in s]
+    codes += [0] * (-len(codes) % 4)
+    return bytes(a << 6 | b << 4 | c << 2 | d for a, b, c, d in zip(codes[0::4], codes[1::4], codes[2::4], codes[3::4]))
+
+
+def format_block(s, fmt, width): # bytes of a block starting at a line (or byte) boundary
+    if fmt == 'packed':
+        return pack(s)
+    return ''.join(s[k:k + width] + '\n' for k in range(0, len(s), width)).encode('ascii')
+
+
+def _write_block(root, begin, end, offset):
+    path, fmt, width = _output
+    data = format_block(expand(_grammar, root, begin, end), fmt, width)
+    with open(path, 'r+b') as f, mmap.mmap(f.fileno(), 0) as out:
+        out[offset:offset + len(data)] = data
+
+
+def layout(G, roots, names, fmt, width):
+    """
+    Returns the lengths of the documents, the output offsets of their data,
+    the headers as (offset, bytes) and the size of the output file.
+    """
+    lengths = [G.length(root) if root != 0 else 0 for root in roots]
+    offsets, headers = [], []
+    if fmt == 'packed':
+        header = ('2bit %d' % len(roots) + ''.join(' %d' % n for n in lengths) + '\n').encode('ascii')
+        headers.append((0, header))
+        pos = len(header)
+        for n in lengths:
+            offsets.append(pos)
+            pos += (n + 3) // 4
+        return lengths, offsets, headers, pos
+    pos = 0
+    for d, n in enumerate(lengths):
+        header = f'>{names[d] if d < len(names) else d}\n'.encode()
+        headers.append((pos, header))
+        pos += len(header)
+        offsets.append(pos)
+        pos += n + (n + width - 1) // width
+    return lengths, offsets, headers, pos
+
+
+def block_offset(begin, fmt, width): # offset of position begin within the data of its document
+    return begin // 4 if fmt == 'packed' else begin + begin // width
+
+
+def decompress(G, path, names=None, fmt='fasta', width=60, workers=1, block=1 << 20):
+    """
+    Writes the documents of G (its roots, or the start) to path as FASTA
+    (fmt='fasta', lines of width) or 2-bit packed (fmt='packed', ACGT only).
+    The output is preallocated and mapped; blocks of about block symbols are
+    expanded by workers processes (in-process for workers <= 1).
+    """
+    roots = G.roots if G.roots else [G.start]
+    for a, b in G.rules[1:]:
+        if a == 0 and not (isinstance(b, str) and len(b) == 1 and (fmt != 'packed' or b in PACKED_CODES)):
+            raise ValueError(f"Terminal {b!r} cannot be written in the {fmt} format")
+    lengths, offsets, headers, size = layout(G, roots, names or [], fmt, width)
+    unit = 4 if fmt == 'packed' else width # blocks hold whole bytes / whole lines
+    block = max(unit, block // unit * unit)
+    tasks = [(root, begin, min(begin + block, n), offsets[d] + block_offset(begin, fmt, width))
+             for d, (root, n) in enumerate(zip(roots, lengths)) for begin in range(0, n, block)]
+    with open(path, 'wb') as f:
+        f.truncate(size)
+    if size == 0: return
+    with open(path, 'r+b') as f, mmap.mmap(f.fileno(), size) as out:
+        for pos, header in headers:
+            out[pos:pos + len(header)] = header
+    if workers <= 1:
+        _init_worker(G, path, fmt, width)
+        for task in tasks:
+            _write_block(*task)
+        return
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(G, path, fmt, width)) as pool:
+        for future in [pool.submit(_write_block, *task) for task in tasks]:
+            future.result()
+
+
+def read_packed(f):
+    """
+    Reads a file written with fmt='packed' (opened in binary mode); returns
+    the list of sequences.
+    """
+    header = f.readline().split()
+    if not header or header[0] != b'2bit':
+        raise ValueError("Not a 2-bit packed file")
+    letters = 'ACGT'
+    res = []
+    for n in map(int, header[2:]):
+        data = f.read((n + 3) // 4)
+        res.append(''.join(letters[x >> 6] + letters[x >> 4 & 3] + letters[x >> 2 & 3] + letters[x & 3] for x in data)[:n])
+    return res
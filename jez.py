@@ -1,108 +1,195 @@
 from slp import SLP
-from utils import binary_tree_from_sequence
+from utils import canonical_pair, compress_texts, reverse_complement_pair
 import random
 
 
-def compress_recompression(text, seed=123):
+def recompression_sequences(slp, sequences, compute_bits, reverse_complement=False):
     """
-    Recompression-style SLP with run rules (RLSLP):
-      - start from terminals for each character,
-      - repeatedly:
-          1) block compression: compress maximal runs X^k into run rules,
-          2) pair compression: random partition of symbols into 0/1 and
-             compress all 0-1 pairs into binary rules.
-      - fall back to greedy left-to-right pairing if an iteration makes no progress.
+    Recompression on a list of sequences sharing one SLP; compute_bits(seq)
+    returns the 0/1 partition used for pair compression in each round. It is
+    called on the concatenation of all sequences, but pairs are never
+    compressed across their boundaries. Returns the list of final sequences.
+
+    With reverse_complement, runs and pairs reuse the rc rule of their
+    reverse complement if it was already compressed in the same round, and
+    the partition is made antisymmetric (rc(x) gets the bit opposite to x),
+    so that a 0-1 pair and its reverse complement are compressed together.
+    Self-complementary symbols p get no bit: in a separate step each one is
+    paired with the neighbour chosen the same way for the mirrored occurrence,
+    so (a, p) and (p, rc(a)) are compressed together.
     """
-    rng = random.Random(seed)
-    slp = SLP()
-    seq = [slp.get_preterminal(ch) for ch in text]
+    seqs = [list(seq) for seq in sequences]
 
-    while len(seq) > 1:
-        changed = False
+    def pair_nonterminal(pair_nt, pair): # nonterminal for pair in the current round
+        if pair in pair_nt:
+            return pair_nt[pair]
+        rc_pair = reverse_complement_pair(slp, pair) if reverse_complement else None
+        if rc_pair in pair_nt:
+            nt = slp.reverse_complement(pair_nt[rc_pair])
+        else:
+            nt = slp.new_nonterminal_binary(pair[0], pair[1])
+            if rc_pair == pair: # palindrome
+                slp.reverse_complement(nt)
+        pair_nt[pair] = nt
+        return nt
 
-        # block compression (runs)
+    def pair_palindromes(seq, palindromes, pair_nt): # pairs each self-complementary symbol with one neighbour
+        n = len(seq)
+        def rc_key(sym): # orders a left neighbour a against rc(c) for a right neighbour c
+            rc_sym = slp.find_reverse_complement(sym)
+            return (rc_sym, 0) if rc_sym != 0 else (sym, 1)
+        freq = {}
+        for i in range(n - 1):
+            if seq[i] in palindromes or seq[i + 1] in palindromes:
+                pair = canonical_pair(slp, (seq[i], seq[i + 1]))
+                freq[pair] = freq.get(pair, 0) + 1
+        # the side of an occurrence of p in a p c is the side of the same occurrence in
+        # rc(c) p rc(a) mirrored: the more frequent pair, then the larger neighbour
+        target = {}
+        for i, p in enumerate(seq):
+            if p not in palindromes or n == 1: continue
+            if i == 0 or i == n - 1:
+                target[i] = 1 if i == 0 else n - 2
+                continue
+            left = (freq[canonical_pair(slp, (seq[i - 1], p))], (seq[i - 1], 0))
+            right = (freq[canonical_pair(slp, (p, seq[i + 1]))], rc_key(seq[i + 1]))
+            if left != right:
+                target[i] = i - 1 if left > right else i + 1
+        claims = {}
+        for i, j in target.items():
+            claims[j] = claims.get(j, 0) + 1
+        # a neighbour wanted by two palindromes is left alone, two palindromes pair if they want each other
+        starts = {min(i, j) for i, j in target.items() if (target.get(j) == i if j in target else claims[j] == 1)}
         new_seq = []
         i = 0
-        n = len(seq)
         while i < n:
-            j = i + 1
-            while j < n and seq[j] == seq[i]:
-                j += 1
-            run_len = j - i
-            if run_len >= 2:
-                base = seq[i]
-                nt = slp.new_nonterminal()
-                slp.set_rule_run(nt, base, run_len)
-                new_seq.append(nt)
-                changed = True
+            if i in starts:
+                new_seq.append(pair_nonterminal(pair_nt, (seq[i], seq[i + 1])))
+                i += 2
             else:
                 new_seq.append(seq[i])
-            i = j
-        seq = new_seq
-
-        if len(seq) <= 1:
-            break
+                i += 1
+        return new_seq
 
-        # pair compression with random partition
-        distinct = set(seq)
-        symbol_to_bit = {sym: rng.randint(0, 1) for sym in distinct}
+    while any(len(seq) > 1 for seq in seqs):
+        changed = False
 
-        new_seq = []
-        pair_nt = {}
-        i = 0
-        n = len(seq)
-        while i < n:
-            if i < n - 1:
-                a_sym = seq[i]
-                b_sym = seq[i + 1]
-                if symbol_to_bit[a_sym] == 0 and symbol_to_bit[b_sym] == 1:
-                    pair = (a_sym, b_sym)
-                    if pair in pair_nt:
-                        nt = pair_nt[pair]
+        # block compression (runs)
+        run_nt = {} # (base, run_len) -> nonterminal, only used with reverse_complement
+        for k, seq in enumerate(seqs):
+            new_seq = []
+            i = 0
+            n = len(seq)
+            while i < n:
+                j = i + 1
+                while j < n and seq[j] == seq[i]:
+                    j += 1
+                run_len = j - i
+                if run_len >= 2:
+                    base = seq[i]
+                    rc_base = slp.find_reverse_complement(base) if reverse_complement else 0
+                    if (base, run_len) in run_nt:
+                        nt = run_nt[(base, run_len)]
+                    elif (rc_base, run_len) in run_nt:
+                        nt = slp.reverse_complement(run_nt[(rc_base, run_len)])
                     else:
-                        nt = slp.new_nonterminal()
-                        slp.set_rule_binary(nt, a_sym, b_sym)
-                        pair_nt[pair] = nt
+                        nt = slp.new_nonterminal_run(base, run_len)
+                        if rc_base == base: # palindrome
+                            slp.reverse_complement(nt)
+                    if reverse_complement:
+                        run_nt[(base, run_len)] = nt
                     new_seq.append(nt)
                     changed = True
-                    i += 2
-                    continue
-            new_seq.append(seq[i])
-            i += 1
-        seq = new_seq
+                else:
+                    new_seq.append(seq[i])
+                i = j
+            seqs[k] = new_seq
 
-        # fallback if nothing changed
-        if not changed:
-            if len(seq) <= 1:
-                break
+        if all(len(seq) <= 1 for seq in seqs):
+            break
+
+        # pair compression with the given partition
+        bits = compute_bits([sym for seq in seqs for sym in seq])
+        palindromes = set()
+        if reverse_complement:
+            for sym in list(bits):
+                rc_sym = slp.find_reverse_complement(sym)
+                if rc_sym == sym: # no bit is opposite to itself
+                    palindromes.add(sym)
+                    bits[sym] = None
+                elif sym < rc_sym and rc_sym in bits:
+                    bits[rc_sym] = 1 - bits[sym]
+        pair_nt = {}
+        for k, seq in enumerate(seqs):
             new_seq = []
-            pair_nt = {}
             i = 0
             n = len(seq)
             while i < n:
                 if i < n - 1:
                     a_sym = seq[i]
                     b_sym = seq[i + 1]
-                    pair = (a_sym, b_sym)
-                    if pair in pair_nt:
-                        nt = pair_nt[pair]
+                    if bits[a_sym] == 0 and bits[b_sym] == 1:
+                        new_seq.append(pair_nonterminal(pair_nt, (a_sym, b_sym)))
+                        changed = True
+                        i += 2
+                        continue
+                new_seq.append(seq[i])
+                i += 1
+            seqs[k] = new_seq
+        if palindromes:
+            for k, seq in enumerate(seqs):
+                new_seq = pair_palindromes(seq, palindromes, pair_nt)
+                changed = changed or len(new_seq) < len(seq)
+                seqs[k] = new_seq
+
+        # fallback if nothing changed
+        if not changed:
+            pair_nt = {}
+            for k, seq in enumerate(seqs):
+                new_seq = []
+                n = len(seq)
+                # a sequence and its reverse complement are paired from opposite ends
+                i = n % 2 if reverse_complement and [slp.find_reverse_complement(sym) for sym in reversed(seq)] < seq else 0
+                if i: new_seq.append(seq[0])
+                while i < n:
+                    if i < n - 1:
+                        new_seq.append(pair_nonterminal(pair_nt, (seq[i], seq[i + 1])))
+                        i += 2
                     else:
-                        nt = slp.new_nonterminal()
-                        slp.set_rule_binary(nt, a_sym, b_sym)
-                        pair_nt[pair] = nt
-                    new_seq.append(nt)
-                    i += 2
-                else:
-                    new_seq.append(seq[i])
-                    i += 1
-            seq = new_seq
+                        new_seq.append(seq[i])
+                        i += 1
+                seqs[k] = new_seq
+
+    return seqs
+
 
-    if len(seq) == 1:
-        slp.start = seq[0]
-    else:
-        slp.start = binary_tree_from_sequence(slp, seq)
+def random_bits(seed=123):
+    """
+    Returns compute_bits for recompression_sequences drawing a random partition
+    of the symbols in each round.
+    """
+    rng = random.Random(seed)
+
+    def compute_bits(seq):
+        distinct = set(seq)
+        return {sym: rng.randint(0, 1) for sym in distinct}
+
+    return compute_bits
 
-    return slp
+
+def compress_recompression(text, seed=123, reverse_complement=False, intern=False):
+    """
+    Recompression-style SLP with run rules (RLSLP):
+      - start from terminals for each character,
+      - repeatedly:
+          1) block compression: compress maximal runs X^k into run rules,
+          2) pair compression: random partition of symbols into 0/1 and
+             compress all 0-1 pairs into binary rules.
+      - fall back to greedy left-to-right pairing if an iteration makes no progress.
+    With reverse_complement, rules are shared with reverse complements via rc rules.
+    """
+    compress = lambda slp, seqs, rc: recompression_sequences(slp, seqs, random_bits(seed), rc)
+    return compress_texts(SLP(intern), [text], compress, reverse_complement, collection=False)
 
 
 def _compute_greedy_bits_for_sequence(seq):
@@ -147,94 +234,111 @@ def _compute_greedy_bits_for_sequence(seq):
     return bit
 
 
-def compress_recompression_greedy(text):
+def _compute_counting_bits_for_sequence(seq):
     """
-    Recompression-style RLSLP with deterministic greedy pair partition.
+    Same greedy rule as _compute_greedy_bits_for_sequence, but the pairs are
+    ordered by a counting sort on their frequency, so a round takes O(n).
+    Ties are broken by the first occurrence of a pair instead of by ids.
     """
-    slp = SLP()
-    seq = [slp.get_preterminal(ch) for ch in text]
+    pair_freq = {}
+    n = len(seq)
+    for i in range(n - 1):
+        pair = (seq[i], seq[i + 1])
+        pair_freq[pair] = pair_freq.get(pair, 0) + 1
 
-    while len(seq) > 1:
-        changed = False
+    buckets = [[] for _ in range(n)] # buckets[cnt] = pairs occurring cnt times
+    for pair, cnt in pair_freq.items():
+        buckets[cnt].append(pair)
 
-        # block compression (runs)
-        new_seq = []
-        i = 0
-        n = len(seq)
-        while i < n:
-            j = i + 1
-            while j < n and seq[j] == seq[i]:
-                j += 1
-            run_len = j - i
-            if run_len >= 2:
-                base = seq[i]
-                nt = slp.new_nonterminal()
-                slp.set_rule_run(nt, base, run_len)
-                new_seq.append(nt)
-                changed = True
+    bit = {s: None for s in seq}
+
+    for cnt in reversed(range(n)):
+        for a, b in buckets[cnt]:
+            ba = bit[a]
+            bb = bit[b]
+            if ba is None and bb is None:
+                bit[a] = 0
+                bit[b] = 1
+            elif ba is None and bb is not None:
+                if bb == 1:
+                    bit[a] = 0
+            elif ba is not None and bb is None:
+                if ba == 0:
+                    bit[b] = 1
+
+    for s in bit:
+        if bit[s] is None:
+            bit[s] = 0
+
+    return bit
+
+
+def _compute_left_right_bits_for_sequence(seq):
+    """
+    Jez's deterministic left/right partition in O(n):
+      - symbols are assigned in order of first occurrence; each one goes to the
+        side that crosses more occurrences of pairs with already assigned symbols,
+      - if afterwards right-left pairs outnumber left-right ones, the sides are swapped.
+    At least 1/4 of the pair occurrences (a != b) become 0-1 pairs.
+    """
+    order = {}
+    for s in seq:
+        if s not in order:
+            order[s] = len(order)
+
+    # group the pair occurrences by the symbol that is assigned later
+    later = {s: {} for s in order}
+    n = len(seq)
+    for i in range(n - 1):
+        a, b = seq[i], seq[i + 1]
+        if a == b: continue
+        c = a if order[a] > order[b] else b
+        later[c][(a, b)] = later[c].get((a, b), 0) + 1
+
+    bit = {}
+    for c in order:
+        to_left = 0 # occurrences crossing the cut if c goes left (bit 0)
+        to_right = 0
+        for (a, b), cnt in later[c].items():
+            other = b if a == c else a
+            if bit[other] == 1:
+                to_left += cnt
             else:
-                new_seq.append(seq[i])
-            i = j
-        seq = new_seq
+                to_right += cnt
+        bit[c] = 0 if to_left >= to_right else 1
 
-        if len(seq) <= 1:
-            break
+    left_right = 0
+    right_left = 0
+    for i in range(n - 1):
+        ba, bb = bit[seq[i]], bit[seq[i + 1]]
+        if ba == 0 and bb == 1:
+            left_right += 1
+        elif ba == 1 and bb == 0:
+            right_left += 1
+    if right_left > left_right:
+        for c in bit:
+            bit[c] = 1 - bit[c]
 
-        # pair compression with greedy partition
-        bits = _compute_greedy_bits_for_sequence(seq)
-        new_seq = []
-        pair_nt = {}
-        i = 0
-        n = len(seq)
-        while i < n:
-            if i < n - 1:
-                a_sym = seq[i]
-                b_sym = seq[i + 1]
-                if bits[a_sym] == 0 and bits[b_sym] == 1:
-                    pair = (a_sym, b_sym)
-                    if pair in pair_nt:
-                        nt = pair_nt[pair]
-                    else:
-                        nt = slp.new_nonterminal()
-                        slp.set_rule_binary(nt, a_sym, b_sym)
-                        pair_nt[pair] = nt
-                    new_seq.append(nt)
-                    changed = True
-                    i += 2
-                    continue
-            new_seq.append(seq[i])
-            i += 1
-        seq = new_seq
+    return bit
 
-        # fallback if nothing changed
-        if not changed:
-            if len(seq) <= 1:
-                break
-            new_seq = []
-            pair_nt = {}
-            i = 0
-            n = len(seq)
-            while i < n:
-                if i < n - 1:
-                    a_sym = seq[i]
-                    b_sym = seq[i + 1]
-                    pair = (a_sym, b_sym)
-                    if pair in pair_nt:
-                        nt = pair_nt[pair]
-                    else:
-                        nt = slp.new_nonterminal()
-                        slp.set_rule_binary(nt, a_sym, b_sym)
-                        pair_nt[pair] = nt
-                    new_seq.append(nt)
-                    i += 2
-                else:
-                    new_seq.append(seq[i])
-                    i += 1
-            seq = new_seq
 
-    if len(seq) == 1:
-        slp.start = seq[0]
-    else:
-        slp.start = binary_tree_from_sequence(slp, seq)
+GREEDY_PARTITIONS = {
+    'sort': _compute_greedy_bits_for_sequence,
+    'counting': _compute_counting_bits_for_sequence,
+    'left-right': _compute_left_right_bits_for_sequence,
+}
+
 
-    return slp
\ No newline at end of file
+def compress_recompression_greedy(text, partition='sort', reverse_complement=False, intern=False):
+    """
+    Recompression-style RLSLP with deterministic greedy pair partition.
+    partition selects how the symbols are split in each round:
+      - 'sort': greedy over pairs sorted by frequency (O(p log p) per round),
+      - 'counting': the same greedy with a counting sort (O(n) per round),
+      - 'left-right': Jez's left/right heuristic (O(n) per round, covers >= 1/4 of pairs).
+    With reverse_complement, rules are shared with reverse complements via rc rules.
+    """
+    if partition not in GREEDY_PARTITIONS:
+        raise ValueError(f'Unknown partition {partition}')
+    compress = lambda slp, seqs, rc: recompression_sequences(slp, seqs, GREEDY_PARTITIONS[partition], rc)
+    return compress_texts(SLP(intern), [text], compress, reverse_complement, collection=False)
@@ -4,6 +4,14 @@ from repair import compress_repair
 from sequitur import compress_sequitur
 from tests import repair_adversary
 from balancing import balance
+from repair_external import compress_repair_external
+from decompress import decompress
+from avl import concat
+
+import os
+import random
+import time
+import tracemalloc
 
 def test(s):
     # print("Testing on:", s)
@@ -38,9 +46,101 @@ def get_samples():
     print(sizes)
     print(depths)
 
+def random_dna(n, mutation_rate=0.01, copies=1, seed=0): # copies of a random sequence with point mutations
+    rng = random.Random(seed)
+    base = [rng.choice('ACGT') for _ in range(n)]
+    res = []
+    for _ in range(copies):
+        res += [rng.choice('ACGT') if rng.random() < mutation_rate else ch for ch in base]
+    return ''.join(res)
+
+
+def compare_partitions():
+    # pair partition strategies of recompression: grammar size relative to the text length and time
+    compressors = [
+        ("RecompRand", compress_recompression),
+        ("RecompGreedySort", lambda s: compress_recompression_greedy(s, partition='sort')),
+        ("RecompGreedyCounting", lambda s: compress_recompression_greedy(s, partition='counting')),
+        ("RecompGreedyLeftRight", lambda s: compress_recompression_greedy(s, partition='left-right')),
+    ]
+    inputs = [
+        ("adversarial(200)", repair_adversary(200, random_extension_side=True, random_block_order=True)),
+        ("random DNA 10^5", random_dna(100000)),
+        ("20 strains of 10^4", random_dna(10000, copies=20)),
+    ]
+    for input_name, s in inputs:
+        for name, func in compressors:
+            t = time.perf_counter()
+            G = func(s)
+            t = time.perf_counter() - t
+            print(f'{input_name}: size: {G.size()}  ratio: {G.size() / len(s):.4f}  depth: {G.depth()}  time: {t:.3f}s  ({name})')
+        print()
+
+def compare_interning():
+    # grammar size and peak memory (tracemalloc) without / with interning of repeated right-hand sides
+    compressors = [
+        ("RePair", lambda s, i: compress_repair(s, intern=i)),
+        ("Sequitur", lambda s, i: compress_sequitur(s, intern=i)),
+        ("RecompGreedy", lambda s, i: compress_recompression_greedy(s, intern=i)),
+        ("RecompRand", lambda s, i: compress_recompression(s, intern=i)),
+        ("RePairBalanced", lambda s, i: balance(compress_repair(s, intern=i), intern=i)),
+        ("SequiturBalanced", lambda s, i: balance(compress_sequitur(s, intern=i), intern=i)),
+    ]
+    inputs = [
+        ("adversarial(200)", repair_adversary(200, random_extension_side=True, random_block_order=True)),
+        ("10 strains of 500", random_dna(500, copies=10)),
+    ]
+    for input_name, s in inputs:
+        for name, func in compressors:
+            res = []
+            for intern in (False, True):
+                tracemalloc.start()
+                G = func(s, intern)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                res.append((G.size(), peak))
+            (size, peak), (size_i, peak_i) = res
+            print(f'{input_name}: size: {size} -> {size_i} ({size_i / size:.2f}x)  peak memory: {peak >> 10} KiB -> {peak_i >> 10} KiB  ({name})')
+        print()
+
+def compare_external():
+    # external-memory RePair on an input several times larger than the memory budget
+    # (the working sequence alone takes 4 bytes per base on disk)
+    s = random_dna(20000, copies=5)
+    print(f'input: {len(s)} bases, working sequence: {4 * len(s) >> 10} KiB')
+    for budget in (96 << 10, 384 << 10):
+        with open(os.devnull, 'w') as f:
+            tracemalloc.start()
+            t = time.perf_counter()
+            res = compress_repair_external((s[i:i + 60] for i in range(0, len(s), 60)), f, budget)
+            t = time.perf_counter() - t
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        print(f'budget: {budget >> 10} KiB  size: {len(res.terminals) + res.rules}  rounds: {res.rounds}  passes: {res.passes}  peak memory: {peak >> 10} KiB  time: {t:.3f}s')
+
+def compare_decompression(path='decompressed.fa'):
+    # full decompression with 1, 2, 4, ... worker processes (up to the number of cores)
+    G = compress_recompression_greedy(random_dna(20000, copies=5))
+    for _ in range(5):
+        concat(G, G) # 32 copies, 3.2 Mbp
+    workers = 1
+    while True:
+        for fmt in ('fasta', 'packed'):
+            t = time.perf_counter()
+            decompress(G, path, fmt=fmt, workers=workers)
+            t = time.perf_counter() - t
+            print(f'length: {G.length()}  workers: {workers}  format: {fmt}  size: {os.path.getsize(path) >> 10} KiB  time: {t:.3f}s')
+        if workers >= (os.cpu_count() or 1): break
+        workers *= 2
+    os.remove(path)
+
 # if __name__ == "__main__":
     # test(repair_adversary(200, random_extension_side=True, random_block_order=True))
     # get_samples()
+    # compare_partitions()
+    # compare_interning()
+    # compare_external()
+    # compare_decompression()
     # s = repair_adversary(200)
     # G = compress_sequitur(s)
     # balance(G)
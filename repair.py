@@ -1,26 +1,28 @@
 from slp import SLP
-from utils import binary_tree_from_sequence
+from utils import compress_texts, canonical_pair, reverse_complement_pair
 
-def compress_repair(text):
+def repair_sequences(slp, sequences, reverse_complement=False):
     """
-    Simple RePair-style grammar compressor using the SLP structure.
-    Produces a pure CNF SLP (no run rules).
+    RePair on a list of sequences of nonterminals sharing one SLP: pairs are
+    counted over all sequences, but never across their boundaries.
+    With reverse_complement, a pair and its reverse complement are counted
+    together and replaced by X and rc(X). Returns the list of final sequences.
     """
-    slp = SLP()
-    sequence = [slp.get_preterminal(ch) for ch in text]
+    sequences = [list(seq) for seq in sequences]
 
     while True:
-        if len(sequence) < 2:
-            break
-
         # count bi-gram frequencies
         pair_freq = {}
-        n = len(sequence)
-        for i in range(n - 1):
-            pair = (sequence[i], sequence[i + 1])
-            if pair not in pair_freq:
-                pair_freq[pair] = 0
-            pair_freq[pair] += 1
+        representative = {} # canonical pair -> its first occurring orientation
+        for sequence in sequences:
+            n = len(sequence)
+            for i in range(n - 1):
+                pair = (sequence[i], sequence[i + 1])
+                if reverse_complement:
+                    pair = representative.setdefault(canonical_pair(slp, pair), pair)
+                if pair not in pair_freq:
+                    pair_freq[pair] = 0
+                pair_freq[pair] += 1
 
         # find most frequent pair
         best_pair = None
@@ -37,27 +39,35 @@ def compress_repair(text):
 
         # compose a production X -> A B
         A, B = best_pair
-        X = slp.new_nonterminal()
-        slp.set_rule_binary(X, A, B)
-
-        # replace all non-overlapping occurrences of (A B)
-        new_seq = []
-        i = 0
-        n = len(sequence)
-        while i < n:
-            if i < n - 1 and sequence[i] == A and sequence[i + 1] == B:
-                new_seq.append(X)
-                i += 2
-            else:
-                new_seq.append(sequence[i])
-                i += 1
-        sequence = new_seq
-
-    # final start symbol
-    if len(sequence) == 1:
-        slp.start = sequence[0]
-    else:
-        # print(f'naive for: {sequence}')
-        slp.start = binary_tree_from_sequence(slp, sequence)
-
-    return slp
\ No newline at end of file
+        rc_pair = reverse_complement_pair(slp, best_pair) if reverse_complement else None
+        X = slp.new_nonterminal_binary(A, B)
+        X_rc = slp.reverse_complement(X) if rc_pair == best_pair else 0 # palindromes are their own rc; otherwise created at the first occurrence of rc_pair
+
+        # replace all non-overlapping occurrences of (A B) (and of its reverse complement)
+        for k, sequence in enumerate(sequences):
+            new_seq = []
+            i = 0
+            n = len(sequence)
+            while i < n:
+                if i < n - 1 and sequence[i] == A and sequence[i + 1] == B:
+                    new_seq.append(X)
+                    i += 2
+                elif rc_pair is not None and i < n - 1 and (sequence[i], sequence[i + 1]) == rc_pair:
+                    if X_rc == 0: X_rc = slp.reverse_complement(X)
+                    new_seq.append(X_rc)
+                    i += 2
+                else:
+                    new_seq.append(sequence[i])
+                    i += 1
+            sequences[k] = new_seq
+
+    return sequences
+
+
+def compress_repair(text, reverse_complement=False, intern=False):
+    """
+    Simple RePair-style grammar compressor using the SLP structure.
+    Produces a pure CNF SLP (no run rules), unless reverse_complement is set:
+    then pairs are shared with their reverse complements via rc rules.
+    """
+    return compress_texts(SLP(intern), [text], repair_sequences, reverse_complement, collection=False)
@@ -0,0 +1,266 @@
+"""
+External-memory RePair for inputs larger than RAM.
+
+The working sequence is a file of 32-bit symbols accessed through mmap and
+rewritten in place, the binary rules are appended to a spill file, and only
+bounded structures are kept in memory:
+
+- each round counts pairs chunk by chunk into a Misra-Gries summary of at
+  most k counters (every pair with frequency > N / (k + 1) survives), then
+  recounts the surviving candidates exactly in a second pass (skipped when
+  the summary was never pruned, i.e. is already exact);
+- once the summary is pruned and finds no repeated pair (all frequencies
+  are small), the pairs are split into hash classes that each fit in the
+  budget; each round counts exactly as many classes as fit together, and
+  the scan replacing their repeated pairs counts the classes of the next
+  round;
+- all candidates with frequency >= ratio * (best frequency) that do not
+  overlap (no pair starts with the second symbol of another one) are
+  replaced in a single left-to-right scan.
+
+With ratio = 1 a round replaces only the most frequent pairs, like RePair;
+smaller ratios need fewer scans at a small cost in grammar size. The final
+sequence is closed by a balanced tree built level by level.
+The grammar is written in the format of save_slp without loading it.
+"""
+import heapq
+import mmap
+import os
+import tempfile
+from array import array
+from collections import Counter
+
+ENTRY_BYTES = 256 # rough size of one pair counter (dict slot, tuple key of two ints, int value)
+SYMBOL_BYTES = 4
+
+
+def parse_size(s): # '512M' -> 536870912
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+    s = s.strip().upper().rstrip('B')
+    if s and s[-1] in units:
+        return int(float(s[:-1]) * units[s[-1]])
+    return int(s)
+
+
+class ExternalRePair:
+    def __init__(self, memory_budget, workdir=None, ratio=0.5):
+        self.summary_size = max(16, memory_budget // (3 * ENTRY_BYTES)) # k counters
+        self.entries = max(16, memory_budget // (2 * ENTRY_BYTES)) # exact counters of a sweep scan
+        self.chunk = 2 * max(128, memory_budget // (12 * ENTRY_BYTES)) # symbols per scanned chunk (even)
+        self.ratio = ratio
+        self.workdir = workdir
+        self.terminals = [] # terminals[i] is the terminal of nonterminal i + 1
+        self.rules = 0 # binary rules written to the spill file
+        self.passes = 0 # scans of the working sequence
+        self.rounds = 0
+        self.n = 0
+        self.length = 0 # of the text
+
+    def new_rule(self, a, b):
+        self.spill.write(array('i', (a, b)).tobytes())
+        self.rules += 1
+        return len(self.terminals) + self.rules
+
+    def load_text(self, chunks): # writes the preterminals of the text to the working file
+        ids = {}
+        with open(self.seq_path, 'wb') as f:
+            for text in chunks:
+                out = array('I')
+                for ch in text:
+                    if ch not in ids:
+                        self.terminals.append(ch)
+                        ids[ch] = len(self.terminals)
+                    out.append(ids[ch])
+                out.tofile(f)
+                self.n += len(out)
+        self.length = self.n
+
+    def read(self, begin, end): # symbols [begin, end) of the working sequence
+        seq = array('I')
+        seq.frombytes(self.mm[begin * SYMBOL_BYTES:end * SYMBOL_BYTES])
+        return seq
+
+    def chunks(self): # overlapping by one symbol, so that every pair lies in one chunk
+        self.passes += 1
+        for begin in range(0, self.n - 1, self.chunk):
+            yield self.read(begin, min(begin + self.chunk + 1, self.n))
+
+    def count_candidates(self):
+        """
+        Returns a dict of candidate pairs with their exact frequencies and
+        whether the summary was pruned (pairs may be missing).
+        """
+        k = self.summary_size
+        summary = {}
+        pruned = False
+        for seq in self.chunks():
+            for pair, count in Counter(zip(seq, seq[1:])).items():
+                summary[pair] = summary.get(pair, 0) + count
+            if len(summary) > k: # Misra-Gries merge: subtract the (k + 1)-th largest count
+                cut = heapq.nlargest(k + 1, summary.values())[-1]
+                summary = {pair: count - cut for pair, count in summary.items() if count > cut}
+                pruned = True
+        if not pruned:
+            return summary, False
+        exact = dict.fromkeys(summary, 0)
+        for seq in self.chunks():
+            for pair, count in Counter(zip(seq, seq[1:])).items():
+                if pair in exact:
+                    exact[pair] += count
+        return exact, True
+
+    def count_classes(self, lo, hi, classes): # frequencies of the pairs with hash class in [lo, hi)
+        freq = Counter()
+        for seq in self.chunks():
+            freq.update(pair for pair in zip(seq, seq[1:]) if lo <= hash(pair) % classes < hi)
+        return freq
+
+    def sweep_partitioned(self):
+        """
+        Exact rounds over the hash classes of pairs. There are ceil(n / entries)
+        classes (entries: counters that fit in the budget), so one class always
+        fits; each round counts as many consecutive classes as the distinct
+        pairs seen so far per class let fit in the budget. The scan replacing
+        the repeated pairs of a round also counts the classes of the next one.
+        Returns False if no pair was replaced.
+        """
+        classes = -(-self.n // self.entries)
+        replaced = False
+        c, end, counted = 0, 1, 0 # classes [c, end) are counted in freq; counted: distinct pairs before end
+        freq = self.count_classes(c, end, classes)
+        while True:
+            counted += len(freq)
+            c, end = end, min(classes, end + max(1, self.entries * end // max(counted, 1))) # at the average class size
+            chosen = self.select(freq)
+            if chosen:
+                freq = self.replace(chosen, (c, end, classes) if c < classes else None)
+                self.rounds += 1
+                replaced = True
+            elif c < classes:
+                freq = self.count_classes(c, end, classes)
+            if c == classes:
+                return replaced
+
+    def select(self, freq):
+        """
+        Returns {pair: new nonterminal} for the non-overlapping pairs replaced
+        in this round (empty if no pair occurs twice).
+        """
+        pairs = sorted((pair for pair, count in freq.items() if count >= 2), key=lambda p: (-freq[p], p))
+        if not pairs: return {}
+        threshold = max(2, self.ratio * freq[pairs[0]])
+        firsts, seconds = set(), set()
+        chosen = {}
+        for a, b in pairs:
+            if freq[(a, b)] < threshold: break
+            if a in seconds or b in firsts: continue
+            chosen[(a, b)] = self.new_rule(a, b)
+            firsts.add(a)
+            seconds.add(b)
+        return chosen
+
+    def replace(self, chosen, classes=None):
+        """
+        Replaces the occurrences of the chosen pairs left to right, rewriting
+        the working sequence in place. With classes = (lo, hi, count), also
+        returns the frequencies of the pairs of the new sequence whose hash
+        class (modulo count) is in [lo, hi), so a sweep needs no separate scan.
+        """
+        self.passes += 1
+        w = 0
+        carry = array('I')
+        freq = Counter()
+        last = None # last symbol written, for the pair across chunks
+        for begin in range(0, self.n, self.chunk):
+            end = min(begin + self.chunk, self.n)
+            seq = carry + self.read(begin, end)
+            out = array('I')
+            i, m = 0, len(seq)
+            while i < m - 1:
+                X = chosen.get((seq[i], seq[i + 1]))
+                if X is not None:
+                    out.append(X)
+                    i += 2
+                else:
+                    out.append(seq[i])
+                    i += 1
+            carry = seq[i:] if end < self.n else array('I')
+            if i < m and end == self.n:
+                out.append(seq[i])
+            if classes is not None and out:
+                lo, hi, count = classes
+                prev = out if last is None else array('I', [last]) + out
+                freq.update(pair for pair in zip(prev, prev[1:]) if lo <= hash(pair) % count < hi)
+                last = out[-1]
+            self.mm[w * SYMBOL_BYTES:(w + len(out)) * SYMBOL_BYTES] = out.tobytes()
+            w += len(out)
+        self.n = w
+        return freq
+
+    def pair_up(self):
+        # one level of the final balanced tree: (s[2i], s[2i + 1]) -> new rule
+        self.passes += 1
+        w = 0
+        for begin in range(0, self.n, self.chunk): # chunk is even, pairs never cross chunks
+            seq = self.read(begin, min(begin + self.chunk, self.n))
+            out = array('I', (self.new_rule(seq[i], seq[i + 1]) for i in range(0, len(seq) - 1, 2)))
+            if len(seq) % 2: out.append(seq[-1])
+            self.mm[w * SYMBOL_BYTES:(w + len(out)) * SYMBOL_BYTES] = out.tobytes()
+            w += len(out)
+        self.n = w
+
+    def write_grammar(self, f, start, names):
+        f.write(f'slp {start} {len(self.terminals) + self.rules}\n')
+        f.write('roots\n')
+        f.write('names' + ''.join(f'\t{name}' for name in (names or [])) + '\n')
+        for ch in self.terminals:
+            f.write(f'T {ch!r}\n')
+        self.spill.seek(0)
+        while True:
+            rules = array('i')
+            rules.frombytes(self.spill.read(self.chunk * 2 * SYMBOL_BYTES))
+            if not rules: break
+            f.write(''.join(f'B {rules[i]} {rules[i + 1]}\n' for i in range(0, len(rules), 2)))
+
+    def run(self, chunks, f, names=None):
+        """
+        Compresses the text given as an iterable of strings and writes the
+        grammar to the text file f. Returns the start symbol.
+        """
+        with tempfile.TemporaryDirectory(dir=self.workdir) as tmp:
+            self.seq_path = os.path.join(tmp, 'sequence')
+            self.load_text(chunks)
+            with open(os.path.join(tmp, 'rules'), 'w+b') as self.spill:
+                start = 0
+                if self.n > 0:
+                    with open(self.seq_path, 'r+b') as seq_file:
+                        self.mm = mmap.mmap(seq_file.fileno(), self.n * SYMBOL_BYTES)
+                        try:
+                            while self.n > 1:
+                                freq, pruned = self.count_candidates()
+                                chosen = self.select(freq)
+                                if chosen:
+                                    self.replace(chosen)
+                                    self.rounds += 1
+                                elif not pruned or not self.sweep_partitioned():
+                                    break
+                            while self.n > 1:
+                                self.pair_up()
+                            start = self.read(0, 1)[0]
+                        finally:
+                            self.mm.close()
+                self.write_grammar(f, start, names)
+        return start
+
+
+def compress_repair_external(chunks, f, memory_budget=256 << 20, workdir=None, ratio=0.5, names=None):
+    """
+    External-memory RePair of the text given as an iterable of strings (e.g.
+    stream_fasta); the grammar is written to the text file f (see save_slp).
+    memory_budget bounds the pair counters and scanned chunks in bytes, the
+    working sequence and the rules are kept in temporary files in workdir.
+    Returns the ExternalRePair object with the statistics (length, rules, rounds, passes).
+    """
+    compressor = ExternalRePair(memory_budget, workdir, ratio)
+    compressor.run(chunks, f, names)
+    return compressor
@@ -1,28 +1,29 @@
 from slp import SLP
-from utils import binary_tree_from_sequence
+from utils import compress_texts, canonical_pair, reverse_complement_pair
 
-def compress_sequitur(text):
+
+def sequitur_sequences(slp, sequences, reverse_complement=False):
     """
-    Sequitur-inspired offline grammar:
-      - repeatedly finds a digram that appears at least twice,
-      - introduces / reuses a rule for that digram,
-      - replaces all non-overlapping occurrences by the rule.
-    Non-start rules are always of length 2; start is converted to CNF.
+    Sequitur on a list of start sequences sharing one SLP: digrams are
+    searched in all of them (never across their boundaries) and rules are
+    shared. With reverse_complement, a digram and its reverse complement
+    count as the same digram. Returns the list of final start sequences.
     """
-    slp = SLP()
-    start_seq = [slp.get_preterminal(ch) for ch in text]
-
-    # Use 0 as a special key representing the start sequence (not a real nonterminal)
+    # Keys <= 0 are special keys representing the start sequences (not real nonterminals):
+    # sequence k is stored under -k
     START_KEY = 0
-    rules = {START_KEY: list(start_seq)}  # key -> list of SLP nonterminals
+    rules = {START_KEY - k: list(seq) for k, seq in enumerate(sequences)}  # key -> list of SLP nonterminals
 
     while True:
         # build mapping digram -> list of (rule_key, index)
         digram_positions = {}
+        representative = {} # canonical digram -> its first occurring orientation
         for rname, rhs in rules.items():
             length = len(rhs)
             for i in range(length - 1):
                 digram = (rhs[i], rhs[i + 1])
+                if reverse_complement:
+                    digram = representative.setdefault(canonical_pair(slp, digram), digram)
                 digram_positions.setdefault(digram, []).append((rname, i))
 
         chosen_digram = None
@@ -35,22 +36,24 @@ def compress_sequitur(text):
             break
 
         a_sym, b_sym = chosen_digram
+        rc_digram = reverse_complement_pair(slp, chosen_digram) if reverse_complement else None
 
         # check if there is already a rule with exactly this RHS
         reuse_nt = None
         for key, rhs in rules.items():
-            if key == START_KEY:
+            if key <= START_KEY:
                 continue
             if len(rhs) == 2 and rhs[0] == a_sym and rhs[1] == b_sym:
                 reuse_nt = key
                 break
 
         if reuse_nt is None:
-            reuse_nt = slp.new_nonterminal()
+            reuse_nt = slp.new_nonterminal_binary(a_sym, b_sym)
             rules[reuse_nt] = [a_sym, b_sym]
-            slp.set_rule_binary(reuse_nt, a_sym, b_sym)
 
-        # replace all occurrences of chosen_digram in all rules except its own
+        rc_nt = slp.reverse_complement(reuse_nt) if rc_digram == chosen_digram else 0 # palindromes are their own rc; otherwise created at the first occurrence of rc_digram
+
+        # replace all occurrences of chosen_digram (and of its reverse complement) in all rules except its own
         for rname, rhs in list(rules.items()):
             if rname == reuse_nt:
                 continue
@@ -61,17 +64,25 @@ def compress_sequitur(text):
                 if i < length - 1 and rhs[i] == a_sym and rhs[i + 1] == b_sym:
                     new_rhs.append(reuse_nt)
                     i += 2
+                elif rc_digram is not None and i < length - 1 and (rhs[i], rhs[i + 1]) == rc_digram:
+                    if rc_nt == 0: rc_nt = slp.reverse_complement(reuse_nt)
+                    new_rhs.append(rc_nt)
+                    i += 2
                 else:
                     new_rhs.append(rhs[i])
                     i += 1
             rules[rname] = new_rhs
 
-    final_seq = rules[START_KEY]
-    if len(final_seq) == 0:
-        slp.start = 0
-    elif len(final_seq) == 1:
-        slp.start = final_seq[0]
-    else:
-        slp.start = binary_tree_from_sequence(slp, final_seq)
+    return [rules[START_KEY - k] for k in range(len(sequences))]
 
-    return slp
\ No newline at end of file
+
+def compress_sequitur(text, reverse_complement=False, intern=False):
+    """
+    Sequitur-inspired offline grammar:
+      - repeatedly finds a digram that appears at least twice,
+      - introduces / reuses a rule for that digram,
+      - replaces all non-overlapping occurrences by the rule.
+    Non-start rules are always of length 2; start is converted to CNF.
+    With reverse_complement, digrams are shared with their reverse complements via rc rules.
+    """
+    return compress_texts(SLP(intern), [text], sequitur_sequences, reverse_complement, collection=False)
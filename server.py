@@ -0,0 +1,319 @@
+"""
+Asyncio query server over a grammar loaded once:
+
+    python server.py serve genome.slp --port 7000          (or --unix /tmp/slp.sock)
+    python server.py bench genome.slp --clients 64 --requests 1000 [--extract-ratio 0.5 --workers 4 --heavy 10000]
+
+Protocol: one request per line, one reply line per request, in order:
+
+    access <doc> <pos>                   -> terminal
+    extract <doc> <begin> <end>          -> substring (end excluded)
+    count <doc> <begin> <end> <symbols>  -> number of positions in [begin, end) holding one of symbols
+    stats                                -> counters (JSON)
+
+Errors are answered with "ERR <message>". Access requests arriving while a
+batch is being answered are coalesced and answered by one access_many call
+per document. extract / count requests longer than --heavy are sent to an
+optional process pool whose workers hold their own read-only grammar copy.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from slp import load_slp
+
+MAX_IN_FLIGHT = 4096 # requests of one connection answered at once; reading waits beyond that
+_grammar = None # grammar of a pool worker (inherited on fork, loaded otherwise)
+
+
+def _init_worker(path):
+    global _grammar
+    if _grammar is None:
+        with open(path) as f:
+            _grammar = load_slp(f)[0]
+
+
+def _ready():
+    return _grammar is not None
+
+
+def _extract(root, begin, end):
+    return ''.join(map(str, _grammar.extract(begin, end, root)))
+
+
+def _count(root, begin, end, symbols):
+    return sum(1 for x in _grammar.extract(begin, end, root) if str(x) in symbols)
+
+
+class Counters:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.requests = {}       # kind -> number of answered requests
+        self.latency = {}        # kind -> total latency in seconds
+        self.max_latency = {}    # kind -> maximal latency in seconds
+        self.batches = 0
+        self.batched = 0         # access requests answered in batches
+
+    def record(self, kind, seconds):
+        self.requests[kind] = self.requests.get(kind, 0) + 1
+        self.latency[kind] = self.latency.get(kind, 0) + seconds
+        self.max_latency[kind] = max(self.max_latency.get(kind, 0), seconds)
+
+    def summary(self):
+        uptime = time.perf_counter() - self.started
+        total = sum(self.requests.values())
+        return {
+            'uptime': round(uptime, 3),
+            'requests': self.requests,
+            'throughput': round(total / uptime, 1) if uptime > 0 else 0,
+            'mean_latency_ms': {k: round(1000 * self.latency[k] / n, 3) for k, n in self.requests.items()},
+            'max_latency_ms': {k: round(1000 * v, 3) for k, v in self.max_latency.items()},
+            'batches': self.batches,
+            'mean_batch': round(self.batched / self.batches, 2) if self.batches else 0,
+        }
+
+
+class GrammarServer:
+    """
+    Answers queries on G; roots[d] is the root of document d.
+    max_batch bounds the number of coalesced access requests (1 disables batching).
+    """
+
+    def __init__(self, G, path=None, max_batch=4096, workers=0, heavy=1 << 16):
+        self.G = G
+        self.roots = G.roots if G.roots else [G.start]
+        self.max_batch = max_batch
+        self.heavy = heavy
+        self.counters = Counters()
+        self.pending = None # queue of (doc, pos, future), created in the running loop
+        self.connections = set() # handler tasks of the open connections
+        self.pool = None
+        if workers > 0:
+            global _grammar
+            _grammar = G # shared with forked workers, loaded from path by spawned ones
+            self.pool = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(path,))
+            # start the workers now, before any socket exists that they could inherit
+            for future in [self.pool.submit(_ready) for _ in range(workers)]:
+                future.result()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+    async def stop(self, srv): # stops listening, waits for the open connections and the pool
+        srv.close()
+        await srv.wait_closed()
+        await asyncio.gather(*self.connections, return_exceptions=True)
+        self.batcher.cancel()
+        self.close()
+
+    def root(self, doc):
+        if doc < 0 or doc >= len(self.roots):
+            raise IndexError("Invalid document")
+        return self.roots[doc]
+
+    def length(self, doc):
+        root = self.root(doc)
+        return 0 if root == 0 else self.G.length(root)
+
+    async def batch_loop(self):
+        while True:
+            batch = [await self.pending.get()]
+            while len(batch) < self.max_batch and not self.pending.empty():
+                batch.append(self.pending.get_nowait())
+            self.counters.batches += 1
+            self.counters.batched += len(batch)
+            by_doc = {}
+            for item in batch:
+                by_doc.setdefault(item[0], []).append(item)
+            for doc, items in by_doc.items():
+                try:
+                    res = self.G.access_many([pos for _, pos, _ in items], self.root(doc))
+                except IndexError:
+                    # answer one by one, so only the invalid requests fail
+                    for _, pos, future in items:
+                        try:
+                            future.set_result(self.G.access(pos, self.root(doc)))
+                        except IndexError as e:
+                            future.set_exception(e)
+                    continue
+                for (_, _, future), terminal in zip(items, res):
+                    future.set_result(terminal)
+            await asyncio.sleep(0) # let the connections queue the next batch
+
+    async def access(self, doc, pos):
+        if pos < 0 or pos >= self.length(doc):
+            raise IndexError("Index out of range")
+        future = asyncio.get_running_loop().create_future()
+        await self.pending.put((doc, pos, future))
+        return str(await future)
+
+    async def run_heavy(self, func, *args):
+        if self.pool is not None and args[2] - args[1] >= self.heavy:
+            return await asyncio.get_running_loop().run_in_executor(self.pool, func, *args)
+        global _grammar
+        _grammar = self.G
+        return func(*args)
+
+    async def answer(self, line):
+        started = time.perf_counter()
+        parts = line.split()
+        kind = parts[0] if parts else ''
+        try:
+            if kind == 'access' and len(parts) == 3:
+                res = await self.access(int(parts[1]), int(parts[2]))
+            elif kind in ('extract', 'count') and len(parts) == (4 if kind == 'extract' else 5):
+                doc, begin, end = int(parts[1]), int(parts[2]), int(parts[3])
+                if begin < 0 or end > self.length(doc) or begin > end:
+                    raise IndexError("Range out of bounds")
+                if kind == 'extract':
+                    res = await self.run_heavy(_extract, self.root(doc), begin, end) if begin < end else ''
+                else:
+                    res = await self.run_heavy(_count, self.root(doc), begin, end, parts[4]) if begin < end else 0
+            elif kind == 'stats' and len(parts) == 1:
+                res = json.dumps(self.counters.summary())
+            else:
+                raise ValueError(f"Invalid request: {line.strip()}")
+        except (IndexError, ValueError) as e:
+            return f'ERR {e}'
+        self.counters.record(kind, time.perf_counter() - started)
+        return str(res)
+
+    async def handle(self, reader, writer):
+        # requests of one connection are answered concurrently (so they can share
+        # batches), the replies are written in the order of the requests
+        self.connections.add(asyncio.current_task())
+        replies = asyncio.Queue(maxsize=MAX_IN_FLIGHT)
+
+        async def write_replies():
+            closed = False
+            while True:
+                task = await replies.get()
+                if task is None: break
+                reply = await task
+                if closed: continue # keep consuming, so the reader is never blocked
+                try:
+                    writer.write((reply + '\n').encode())
+                    await writer.drain()
+                except ConnectionError:
+                    closed = True
+
+        writer_task = asyncio.ensure_future(write_replies())
+        try:
+            while True:
+                line = await reader.readline()
+                if not line: break
+                await replies.put(asyncio.ensure_future(self.answer(line.decode())))
+        finally:
+            await replies.put(None)
+            await writer_task
+            writer.close()
+            self.connections.discard(asyncio.current_task())
+
+    async def start(self, host='127.0.0.1', port=0, unix=None):
+        self.pending = asyncio.Queue()
+        self.batcher = asyncio.ensure_future(self.batch_loop())
+        if unix is not None:
+            return await asyncio.start_unix_server(self.handle, path=unix)
+        return await asyncio.start_server(self.handle, host, port)
+
+
+async def serve(path, host='127.0.0.1', port=7000, unix=None, max_batch=4096, workers=0, heavy=1 << 16):
+    with open(path) as f:
+        G, _ = load_slp(f)
+    server = GrammarServer(G, path, max_batch, workers, heavy)
+    try:
+        async with await server.start(host, port, unix) as srv:
+            print(f'serving {path} on {unix or f"{host}:{port}"}', flush=True)
+            await srv.serve_forever()
+    finally:
+        server.close()
+
+
+async def load_generator(host, port, lengths, clients=32, requests=1000, extract_ratio=0.0, extract_length=100, seed=0):
+    """
+    Runs clients concurrent connections, each sending requests queries one
+    at a time (random access, or extract with probability extract_ratio).
+    Returns (seconds, sorted latencies in seconds).
+    """
+    rng = random.Random(seed)
+    latencies = []
+    targets = [doc for doc, n in enumerate(lengths) if n > 0] # empty documents have no positions to query
+    if not targets:
+        raise ValueError("All documents are empty")
+
+    async def client(k):
+        reader, writer = await asyncio.open_connection(host, port)
+        local = random.Random(rng.random())
+        for _ in range(requests):
+            doc = local.choice(targets)
+            if local.random() < extract_ratio:
+                begin = local.randrange(max(lengths[doc] - extract_length, 0) + 1)
+                line = f'extract {doc} {begin} {min(begin + extract_length, lengths[doc])}\n'
+            else:
+                line = f'access {doc} {local.randrange(lengths[doc])}\n'
+            t = time.perf_counter()
+            writer.write(line.encode())
+            await writer.drain()
+            reply = await reader.readline()
+            latencies.append(time.perf_counter() - t)
+            assert not reply.startswith(b'ERR'), reply
+        writer.close()
+        await writer.wait_closed()
+
+    t = time.perf_counter()
+    await asyncio.gather(*[client(k) for k in range(clients)])
+    return time.perf_counter() - t, sorted(latencies)
+
+
+async def bench(path, clients=32, requests=1000, extract_ratio=0.0, workers=0, heavy=1 << 16, extract_length=100):
+    # server and clients in one event loop on localhost; batching on vs. off
+    with open(path) as f:
+        G, _ = load_slp(f)
+    for max_batch in (1, 4096):
+        server = GrammarServer(G, path, max_batch, workers, heavy)
+        srv = await server.start()
+        port = srv.sockets[0].getsockname()[1]
+        lengths = [server.length(d) for d in range(len(server.roots))]
+        seconds, latencies = await load_generator('127.0.0.1', port, lengths, clients, requests, extract_ratio, extract_length)
+        await server.stop(srv)
+        n = len(latencies)
+        print(f'max_batch: {max_batch}    requests: {n}    throughput: {n / seconds:.0f}/s    '
+              f'p50: {1000 * latencies[n // 2]:.2f}ms    p99: {1000 * latencies[min(n - 1, n * 99 // 100)]:.2f}ms    '
+              f'mean batch: {server.counters.summary()["mean_batch"]}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Query server over a stored grammar.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    p = commands.add_parser('serve')
+    p.add_argument('input')
+    p.add_argument('--host', default='127.0.0.1')
+    p.add_argument('--port', type=int, default=7000)
+    p.add_argument('--unix', help='Unix socket path (instead of TCP)')
+    p.add_argument('--max-batch', type=int, default=4096)
+    p.add_argument('--workers', type=int, default=0, help='process pool size for heavy requests')
+    p.add_argument('--heavy', type=int, default=1 << 16, help='extract / count length sent to the pool')
+
+    p = commands.add_parser('bench')
+    p.add_argument('input')
+    p.add_argument('--clients', type=int, default=32)
+    p.add_argument('--requests', type=int, default=1000, help='requests per client')
+    p.add_argument('--extract-ratio', type=float, default=0.0)
+    p.add_argument('--extract-length', type=int, default=100)
+    p.add_argument('--workers', type=int, default=0, help='process pool size for heavy requests')
+    p.add_argument('--heavy', type=int, default=1 << 16, help='extract length sent to the pool')
+
+    args = parser.parse_args(argv)
+    if args.command == 'serve':
+        asyncio.run(serve(args.input, args.host, args.port, args.unix, args.max_batch, args.workers, args.heavy))
+    else:
+        asyncio.run(bench(args.input, args.clients, args.requests, args.extract_ratio, args.workers, args.heavy, args.extract_length))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,9 @@
+from bisect import bisect_left
+
+COMPLEMENT = {'A': 'T', 'C': 'G', 'G': 'C', 'T': 'A', 'N': 'N',
+              'a': 't', 'c': 'g', 'g': 'c', 't': 'a', 'n': 'n'}
+
+
 class SLP: # actually RLSLP
     """
     Rules:
@@ -5,38 +11,94 @@ class SLP: # actually RLSLP
         * if a == 0: terminal rule, i -> terminal "b"
         * if a > 0: binary rule,  i -> a b   (a, b are nonterminal ids)
         * if a < 0: run rule,     i -> b^{-a}  (repeat nonterminal b -a times)
+        * if a is None: reverse-complement rule, i -> rc(b)  (b read backwards, DNA bases complemented)
         
     Nonterminal ids are positive integers. Index 0 is unused.
     """
 
-    def __init__(self):
+    def __init__(self, intern=False):
         self.rules = [(0, '?')]  # rules[nt] = (a, b)
         self.lengths = [-1]       # lengths[nt] = length of expansion; -1 => unknown
+        self.heights = [-1]       # heights[nt] = height in the binary view (see height); -1 => unknown
         self.start = 0           # start nonterminal id (0 = empty)
         self.preterminal = {}    # terminal -> nonterminal id
+        self.roots = []          # start nonterminals of the documents of a collection (0 = empty document)
+        self.rc_of = {}          # nt -> nonterminal deriving the reverse complement of Exp(nt), where known
+        self.interned = {} if intern else None # (a, b) -> nt with this rule; new_nonterminal_* reuse it (None = disabled)
 
     def new_nonterminal(self): # creates a fresh nonterminal id with an empty rule.
         self.rules.append((0, 0))
         self.lengths.append(-1)
+        self.heights.append(-1)
         assert len(self.rules) == len(self.lengths)
         return len(self.rules) - 1
 
+    def enable_interning(self): # starts interning rules, indexing the existing ones (the first of duplicates wins)
+        self.interned = {}
+        for nt in range(len(self.rules) - 1, 0, -1):
+            self.interned[self.rules[nt]] = nt
+
+    def set_rule(self, nt, rule): # sets rules[nt] = rule, keeping the interning table up to date
+        if self.heights[nt] >= 0: # rewriting a known rule (balancing) may change the heights of its ancestors
+            self.heights = [-1] * len(self.rules)
+        if self.interned is not None:
+            old = self.rules[nt]
+            if self.interned.get(old) == nt:
+                del self.interned[old]
+            self.interned.setdefault(rule, nt)
+        self.rules[nt] = rule
+
     def set_rule_terminal(self, nt, terminal): # sets nt -> terminal
-        self.rules[nt] = (0, terminal)
+        self.set_rule(nt, (0, terminal))
 
     def set_rule_binary(self, nt, left, right): # sets nt -> left right (binary rule).
-        self.rules[nt] = (left, right)
+        self.set_rule(nt, (left, right))
         if self.length(nt) != self.length(left) + self.length(right):
             print(f'ntb nt: {nt}({self.length(nt)}) a: {left}({self.length(left)}) b: {right}({self.length(right)})')
             exit(0)
 
-    def new_nonterminal_binary(self, left, right): # sets nt -> left right (binary rule).
+    def new_nonterminal_binary(self, left, right): # returns a nonterminal with nt -> left right (binary rule), an existing one if interned.
+        if self.interned is not None and (left, right) in self.interned:
+            return self.interned[(left, right)]
         nt = self.new_nonterminal()
         self.set_rule_binary(nt, left, right)
         return nt
     
     def set_rule_run(self, nt, base, count): # sets nt -> base^count (run-length rule). Encoded as (-count, base).
-        self.rules[nt] = (-count, base)
+        self.set_rule(nt, (-count, base))
+
+    def new_nonterminal_run(self, base, count): # returns a nonterminal with nt -> base^count, an existing one if interned.
+        if self.interned is not None and (-count, base) in self.interned:
+            return self.interned[(-count, base)]
+        nt = self.new_nonterminal()
+        self.set_rule_run(nt, base, count)
+        return nt
+
+    def set_rule_reverse_complement(self, nt, base): # sets nt -> rc(base). Encoded as (None, base).
+        self.set_rule(nt, (None, base))
+
+    def find_reverse_complement(self, nt): # returns a nonterminal deriving rc(Exp(nt)) if one is known, 0 otherwise
+        a, b = self.rules[nt]
+        if a is None: # reverse complement
+            return b
+        if a == 0: # terminal
+            return self.preterminal.get(COMPLEMENT.get(b), 0)
+        return self.rc_of.get(nt, 0)
+
+    def reverse_complement(self, nt): # returns (and creates if needed) a nonterminal deriving rc(Exp(nt))
+        rc = self.find_reverse_complement(nt)
+        if rc != 0:
+            return rc
+        a, b = self.rules[nt]
+        if a == 0:
+            return self.get_preterminal(COMPLEMENT[b])
+        if (a > 0 and self.find_reverse_complement(b) == a) or (a < 0 and self.find_reverse_complement(b) == b):
+            self.rc_of[nt] = nt # palindrome: rc(a b) = rc(b) rc(a) = a b, rc(b^k) = rc(b)^k = b^k
+            return nt
+        rc = self.new_nonterminal()
+        self.set_rule_reverse_complement(rc, nt)
+        self.rc_of[nt] = rc
+        return rc
 
     def get_preterminal(self, terminal): # returns (and creates if needed) a preterminal nonterminal
         if terminal in self.preterminal:
@@ -46,32 +108,81 @@ class SLP: # actually RLSLP
         self.preterminal[terminal] = nt
         return nt
 
-    def length(self, nt=None): # returns the length of Exp(nt)
+    def length(self, nt=None): # returns the length of Exp(nt); iterative, so deep grammars do not hit the recursion limit
         if nt is None:
             if self.start == 0:
                 raise IndexError("Invalid start symbol")
             nt = self.start
         if self.lengths[nt] >= 0:
             return self.lengths[nt]
-        a, b = self.rules[nt]
-        if a == 0:
-            self.lengths[nt] = 1
-        elif a > 0: # binary
-            self.lengths[nt] = self.length(a) + self.length(b)
-        elif a < 0: # run
-            self.lengths[nt] = (-a) * self.length(b)
-        return self.lengths[nt]
+        lengths = self.lengths
+        stack = [nt]
+        while stack:
+            u = stack[-1]
+            if lengths[u] >= 0:
+                stack.pop()
+                continue
+            a, b = self.rules[u]
+            if a == 0: # terminal
+                lengths[u] = 1
+            elif a is not None and a > 0: # binary
+                if lengths[a] < 0 or lengths[b] < 0:
+                    stack += [x for x in (b, a) if lengths[x] < 0]
+                    continue
+                lengths[u] = lengths[a] + lengths[b]
+            else: # run or reverse complement
+                if lengths[b] < 0:
+                    stack.append(b)
+                    continue
+                lengths[u] = lengths[b] if a is None else (-a) * lengths[b]
+            stack.pop()
+        return lengths[nt]
     
+    def height(self, nt):
+        """
+        Returns the height of nt in the binary view used by the AVL operations
+        (avl.py): a run rule b^k counts as a balanced tree of k copies of b
+        (height h(b) + ceil(log2 k)) and rc(b) as b. Memoized in heights.
+        """
+        heights = self.heights
+        if heights[nt] >= 0:
+            return heights[nt]
+        stack = [nt]
+        while stack:
+            u = stack[-1]
+            if heights[u] >= 0:
+                stack.pop()
+                continue
+            a, b = self.rules[u]
+            if a == 0: # terminal
+                heights[u] = 0
+            elif a is not None and a > 0: # binary
+                if heights[a] < 0 or heights[b] < 0:
+                    stack += [x for x in (b, a) if heights[x] < 0]
+                    continue
+                heights[u] = max(heights[a], heights[b]) + 1
+            else: # run or reverse complement
+                if heights[b] < 0:
+                    stack.append(b)
+                    continue
+                heights[u] = heights[b] if a is None else heights[b] + (-a - 1).bit_length()
+            stack.pop()
+        return heights[nt]
+
     def access(self, index, nt=None): # returns terminal at position 'index' (0-based) by descending the derivation tree
         if nt is None:
             if self.start == 0:
                 raise IndexError("Invalid start symbol")
             nt = self.start
+        if nt == 0: # empty document
+            raise IndexError("Index out of range")
         if index < 0 or index >= self.length(nt):
             print(f'index {index} nt: {nt} length: {self.length(nt)}')
             raise IndexError("Index out of range")
         a, b = self.rules[nt]
-        if a == 0: # terminal
+        if a is None: # reverse complement
+            return COMPLEMENT[self.access(self.length(b) - 1 - index, b)]
+        elif a == 0: # terminal
             return b
         elif a > 0: # binary
             if self.length(nt) != self.length(a) + self.length(b):
@@ -84,18 +195,203 @@ class SLP: # actually RLSLP
         elif a < 0: # run
             return self.access(index % self.length(b), b)
 
+    def access_many(self, positions, nt=None, out=None):
+        """
+        Returns the terminals at all positions (0-based) in input order, in a
+        single traversal of the derivation tree: the sorted positions are
+        split at every binary / run rule, so common upper paths are walked once.
+        out can be a preallocated mutable sequence of len(positions).
+        """
+        if nt is None:
+            if self.start == 0:
+                raise IndexError("Invalid start symbol")
+            nt = self.start
+        order = sorted(range(len(positions)), key=positions.__getitem__)
+        sorted_positions = [positions[k] for k in order]
+        if out is None:
+            out = [None] * len(positions)
+        if not order:
+            return out
+        if nt == 0 or sorted_positions[0] < 0 or sorted_positions[-1] >= self.length(nt): # nt == 0 derives the empty word
+            raise IndexError("Index out of range")
+        stack = [(nt, 0, len(order), 0, False)] # (u, lo, hi, offset, rc): sorted_positions[lo:hi] lie in Exp(u) (or rc(Exp(u))) starting at offset
+        while stack:
+            u, lo, hi, offset, rc = stack.pop()
+            a, b = self.rules[u]
+            if a is None: # reverse complement
+                stack.append((b, lo, hi, offset, not rc))
+            elif a == 0: # terminal
+                terminal = COMPLEMENT[b] if rc else b
+                for k in range(lo, hi):
+                    out[order[k]] = terminal
+            elif a > 0: # binary; rc(a b) = rc(b) rc(a)
+                if rc: a, b = b, a
+                cut = offset + self.length(a)
+                mid = bisect_left(sorted_positions, cut, lo, hi)
+                if mid < hi: stack.append((b, mid, hi, cut, rc))
+                if lo < mid: stack.append((a, lo, mid, offset, rc))
+            elif a < 0: # run; rc(b^k) = rc(b)^k
+                lb = self.length(b)
+                i = lo
+                while i < hi:
+                    begin = offset + (sorted_positions[i] - offset) // lb * lb
+                    j = bisect_left(sorted_positions, begin + lb, i, hi)
+                    stack.append((b, i, j, begin, rc))
+                    i = j
+        return out
+
+    def extract(self, begin, end, nt=None): # returns the terminals at positions begin..end-1 in a single descent
+        if nt is None:
+            if self.start == 0:
+                raise IndexError("Invalid start symbol")
+            nt = self.start
+        n = 0 if nt == 0 else self.length(nt) # nt == 0 derives the empty word (empty document)
+        if begin < 0 or end > n or begin > end:
+            raise IndexError("Range out of bounds")
+        res = []
+        stack = [(nt, begin, end, False)] # (u, i, j, rc): Exp(u)[i:j] (or rc(Exp(u))[i:j]) is still to be written
+        while stack:
+            u, i, j, rc = stack.pop()
+            if i >= j: continue
+            a, b = self.rules[u]
+            if a is None: # reverse complement
+                stack.append((b, i, j, not rc))
+            elif a == 0: # terminal
+                res.append(COMPLEMENT[b] if rc else b)
+            elif a > 0: # binary; rc(a b) = rc(b) rc(a)
+                if rc: a, b = b, a
+                la = self.length(a)
+                if j > la: stack.append((b, max(i - la, 0), j - la, rc))
+                if i < la: stack.append((a, i, min(j, la), rc))
+            elif a < 0: # run; rc(b^k) = rc(b)^k
+                lb = self.length(b)
+                for k in reversed(range(i // lb, (j - 1) // lb + 1)):
+                    stack.append((b, max(i - k * lb, 0), min(j - k * lb, lb), rc))
+        return res
+
+    def compact(self):
+        """
+        Removes the nonterminals unreachable from the start (and the roots)
+        and renumbers the rest so that children precede their parents and the
+        start is the last one. Returns the map old id -> new id.
+        """
+        new_id = {0: 0}
+        rules = [self.rules[0]]
+        lengths = [self.lengths[0]]
+        heights = [self.heights[0]]
+        for root in self.roots + [self.start]:
+            stack = [root]
+            while stack:
+                u = stack[-1]
+                if u in new_id:
+                    stack.pop()
+                    continue
+                a, b = self.rules[u]
+                kids = [] if a == 0 else ([a, b] if a is not None and a > 0 else [b])
+                missing = [x for x in kids if x not in new_id]
+                if missing:
+                    stack.extend(reversed(missing))
+                    continue
+                stack.pop()
+                if a is not None and a > 0: # binary
+                    rules.append((new_id[a], new_id[b]))
+                elif a != 0: # run or reverse complement
+                    rules.append((a, new_id[b]))
+                else: # terminal
+                    rules.append((a, b))
+                lengths.append(self.lengths[u])
+                heights.append(self.heights[u])
+                new_id[u] = len(rules) - 1
+        self.rules = rules
+        self.lengths = lengths
+        self.heights = heights
+        self.start = new_id[self.start]
+        self.roots = [new_id[root] for root in self.roots]
+        self.preterminal = {t: new_id[nt] for t, nt in self.preterminal.items() if nt in new_id}
+        self.rc_of = {new_id[x]: new_id[y] for x, y in self.rc_of.items() if x in new_id and y in new_id}
+        if self.interned is not None:
+            self.enable_interning()
+        return new_id
+
     def size(self): # number of nonterminals (including preterminals)
         return len(self.rules) - 1
 
-    def depth(self, nt=None): # height of the derivation (sub-)tree
+    def depth(self, nt=None): # height of the derivation (sub-)tree; each nonterminal is visited once
         if nt is None:
             if self.start == 0:
                 raise IndexError("Invalid start symbol")
             nt = self.start
-        a, b = self.rules[nt]
-        if a == 0: # terminal
-            return 0
-        if a > 0: # binary
-            return max(self.depth(a), self.depth(b)) + 1
-        if a < 0: # run
-            return self.depth(b) + 1
\ No newline at end of file
+        depths = {}
+        stack = [nt]
+        while stack:
+            u = stack[-1]
+            if u in depths:
+                stack.pop()
+                continue
+            a, b = self.rules[u]
+            if a == 0: # terminal
+                depths[u] = 0
+            elif a is not None and a > 0: # binary
+                if a not in depths or b not in depths:
+                    stack += [x for x in (b, a) if x not in depths]
+                    continue
+                depths[u] = max(depths[a], depths[b]) + 1
+            else: # run or reverse complement
+                if b not in depths:
+                    stack.append(b)
+                    continue
+                depths[u] = depths[b] + 1
+            stack.pop()
+        return depths[nt]
+
+
+def save_slp(G, f, names=None):
+    """
+    Writes G to the text file f, one rule per line (the line number is the
+    nonterminal id): "T <terminal>", "B <a> <b>", "R <count> <base>" or "C <base>".
+    names are optional document names (one per root, or one for the start).
+    """
+    f.write(f'slp {G.start} {len(G.rules) - 1}\n')
+    f.write('roots' + ''.join(f' {root}' for root in G.roots) + '\n')
+    f.write('names' + ''.join(f'\t{name}' for name in (names or [])) + '\n')
+    for a, b in G.rules[1:]:
+        if a is None:
+            f.write(f'C {b}\n')
+        elif a == 0:
+            f.write(f'T {b!r}\n')
+        elif a > 0:
+            f.write(f'B {a} {b}\n')
+        else:
+            f.write(f'R {-a} {b}\n')
+
+
+def load_slp(f): # reads a grammar written by save_slp; returns (G, names)
+    from ast import literal_eval
+    kind, start, n = f.readline().split()
+    if kind != 'slp':
+        raise ValueError("Not an SLP file")
+    G = SLP()
+    G.roots = [int(x) for x in f.readline().split()[1:]]
+    names = f.readline().rstrip('\n').split('\t')[1:]
+    G.rules = [(0, '?')] + [(0, 0)] * int(n)
+    for nt in range(1, int(n) + 1):
+        kind, rest = f.readline().rstrip('\n').split(' ', 1)
+        if kind == 'T':
+            terminal = literal_eval(rest)
+            G.rules[nt] = (0, terminal)
+            G.preterminal[terminal] = nt
+        elif kind == 'B':
+            a, b = rest.split()
+            G.rules[nt] = (int(a), int(b))
+        elif kind == 'R':
+            count, base = rest.split()
+            G.rules[nt] = (-int(count), int(base))
+        elif kind == 'C':
+            G.rules[nt] = (None, int(rest))
+            G.rc_of[int(rest)] = nt
+        else:
+            raise ValueError(f"Unknown rule kind {kind}")
+    G.lengths = [-1] * len(G.rules)
+    G.heights = [-1] * len(G.rules)
+    G.start = int(start)
+    return G, names
@@ -9,6 +9,91 @@ def binary_tree_from_sequence(slp, seq):
     mid = n // 2
     a = binary_tree_from_sequence(slp, seq[:mid])
     b = binary_tree_from_sequence(slp, seq[mid:])
-    root = slp.new_nonterminal()
-    slp.set_rule_binary(root, a, b)
-    return root
+    return slp.new_nonterminal_binary(a, b)
+
+
+
+def root_from_sequence(slp, seq):
+    """
+    Returns a nonterminal deriving exactly seq (0 for an empty sequence),
+    building a balanced binary tree on top of seq if needed.
+    """
+    if len(seq) == 0: return 0
+    if len(seq) == 1: return seq[0]
+    return binary_tree_from_sequence(slp, seq)
+
+
+def compress_texts(slp, texts, compress, reverse_complement=False, collection=True):
+    """
+    Shared driver of the compressors: turns texts into sequences of
+    preterminals of slp, runs compress(slp, sequences, reverse_complement)
+    (e.g. repair_sequences) and roots the final sequences, in slp.roots for a
+    collection or in slp.start for a single text. With intern (SLP(intern=True)),
+    a repeated right-hand side reuses its nonterminal (see SLP.interned).
+    With reverse_complement, the rc rules of pairs that were later compressed
+    further are unreachable and dropped by SLP.compact. Returns slp.
+    """
+    sequences = [[slp.get_preterminal(ch) for ch in text] for text in texts]
+    sequences = compress(slp, sequences, reverse_complement)
+    slp.roots = [root_from_sequence(slp, seq) for seq in sequences]
+    if not collection:
+        [slp.start], slp.roots = slp.roots, []
+    if reverse_complement:
+        slp.compact()
+    return slp
+
+
+def reverse_complement_pair(slp, pair):
+    """
+    Returns the pair of nonterminals deriving the reverse complement of
+    pair, rc(a b) = rc(b) rc(a), or None if one of them does not exist yet
+    (then that pair cannot occur in any sequence).
+    """
+    a, b = pair
+    ra = slp.find_reverse_complement(a)
+    rb = slp.find_reverse_complement(b)
+    if ra == 0 or rb == 0: return None
+    return (rb, ra)
+
+
+def canonical_pair(slp, pair): # the same key for a pair and for its reverse complement
+    rc = reverse_complement_pair(slp, pair)
+    if rc is None or pair <= rc: return pair
+    return rc
+
+
+def read_fasta(f):
+    """
+    Reads FASTA records from the text file f; returns a list of (name, sequence).
+    Lines are stripped, a file without headers gives a single unnamed record.
+    """
+    records = []
+    name, parts = None, []
+    for line in f:
+        line = line.strip()
+        if line.startswith('>'):
+            if name is not None or parts:
+                records.append((name or '', ''.join(parts)))
+            name, parts = line[1:], []
+        elif line:
+            parts.append(line)
+    if name is not None or parts:
+        records.append((name or '', ''.join(parts)))
+    return records
+
+
+def stream_fasta(f, names):
+    """
+    Yields the stripped sequence lines of a single-record FASTA file without
+    reading it whole; the record name is appended to names.
+    Raises ValueError on a second record.
+    """
+    for line in f:
+        line = line.strip()
+        if line.startswith('>'):
+            if names:
+                raise ValueError("Streaming is supported for single-record FASTA files only")
+            names.append(line[1:])
+        elif line:
+            if not names: names.append('')
+            yield line
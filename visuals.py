@@ -1,41 +1,218 @@
-from slp import SLP
+from slp import SLP, COMPLEMENT
 from repair import compress_repair
 from tests import repair_adversary
 from balancing import get_heavy_paths, get_longest_path, balance, balance_longest_path
 
+import sys
 from collections import defaultdict
 
-res = '\\documentclass{standalone}\n\\usepackage{tikz}\n\\begin{document}\n\\begin{tikzpicture}'
-res += '[x=1.5em, y=3em, inner node/.style={circle, draw=black, fill=white, thick, inner sep=1.9pt}, leaf/.style={}, light edge/.style={-{Stealth}, semithick}, heavy edge/.style={light edge, red}]'
-res += '\\usetikzlibrary{arrows.meta}'
+TIKZ_HEADER = '\\documentclass{standalone}\n\\usepackage{tikz}\n\\begin{document}\n\\begin{tikzpicture}'
+TIKZ_HEADER += '[x=1.5em, y=3em, inner node/.style={circle, draw=black, fill=white, thick, inner sep=1.9pt}, leaf/.style={}, light edge/.style={-{Stealth}, semithick}, heavy edge/.style={light edge, red}]'
+TIKZ_HEADER += '\\usetikzlibrary{arrows.meta}'
+TIKZ_FOOTER = '\\end{tikzpicture}\n\\end{document}\n'
 
 edge_styles = defaultdict(lambda: 'light edge')
 node_styles = defaultdict(lambda: 'inner node')
 
-def dfs(G, u=None, span=None, current_id=0):
-    global res
-    id = current_id
-    if u is None:
-        u = G.start
-        span = (0, G.length())
+
+def children(G, u): # list of (child, label) pairs of u in derivation order; run and rc rules give a single labelled child
     a, b = G.rules[u]
-    if a == 0: # terminal
-        x_0, x_1 = span
-        assert x_1 == x_0 + 1
-        position = (x_0 + x_1) / 2
-        res += f'\\node[leaf] ({id}) at ({position},0) {{\\texttt{{{b}}}}};'
-        return (0, id)
-    elif a > 0: # binary
-        x_0, x_1 = span
-        cut = x_0 + G.length(a)
-        depth_a, id_a = dfs(G, a, span=(x_0, cut), current_id=id + 1)
-        depth_b, id_b = dfs(G, b, span=(cut, x_1), current_id=id_a + 1)
-        depth = max(depth_a, depth_b) + 1
-        position = cut
-        res += f'\\node[{node_styles[u]}] ({id}) at ({position},{depth}) {{{u}}};'
-        res += f'\\draw[{edge_styles[(u, a)]}] ({id}) -- ({id_a});'
-        res += f'\\draw[{edge_styles[(u, b)]}] ({id}) -- ({id_b});'
-        return depth, id
+    if a is None: return [(b, 'rc')]
+    if a == 0: return []
+    if a > 0: return [(a, None), (b, None)]
+    return [(b, f'^{-a}')]
+
+
+def reachable_postorder(G, u=None):
+    """
+    Nonterminals reachable from u (default: start), each listed once,
+    children before parents. Iterative, so it works for deep grammars.
+    """
+    if u is None: u = G.start
+    order = []
+    visited = {u}
+    stack = [(u, iter(children(G, u)))]
+    while stack:
+        v, it = stack[-1]
+        for c, _ in it:
+            if c not in visited:
+                visited.add(c)
+                stack.append((c, iter(children(G, c))))
+                break
+        else:
+            stack.pop()
+            order.append(v)
+    return order
+
+
+def heights(G, u=None): # height of every nonterminal reachable from u, computed once per nonterminal
+    h = {}
+    for v in reachable_postorder(G, u):
+        h[v] = max((h[c] + 1 for c, _ in children(G, v)), default=0)
+    return h
+
+
+def dot_quote(x):
+    return '"' + str(x).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def dot_color(style): # translates the TikZ styles used by the show_* helpers into a Graphviz color
+    if 'heavy' in style: return ', color=red'
+    for color in ('blue', 'green'):
+        if color in style: return f', color={color}'
+    return ''
+
+
+def dot_edge(u, c, style, label=None):
+    attrs = dot_color(style)
+    if label is not None: attrs += f', label={dot_quote(label)}'
+    attrs = f' [{attrs[2:]}]' if attrs else ''
+    return f'{u} -> {c}{attrs};\n'
+
+
+def write_dag(G, out, fmt='dot'):
+    """
+    Writes the grammar DAG reachable from G.start: every nonterminal is drawn
+    once, so the output is linear in the grammar size (not in the text length).
+    fmt is 'dot' (Graphviz) or 'tikz' (standalone LaTeX document).
+    """
+    order = reachable_postorder(G)
+    if fmt == 'dot':
+        out.write('digraph G {\nordering=out;\nnode [shape=circle];\n')
+        for u in order:
+            a, b = G.rules[u]
+            if a == 0:
+                out.write(f'n{u} [label={dot_quote(b)}, shape=plaintext];\n')
+                continue
+            out.write(f'n{u} [label="{u}"{dot_color(node_styles[u])}];\n')
+            for c, label in children(G, u):
+                out.write(dot_edge(f'n{u}', f'n{c}', edge_styles[(u, c)], label))
+        out.write('}\n')
+    elif fmt == 'tikz':
+        h = heights(G)
+        slots = defaultdict(int) # next free x position on every level
+        out.write(TIKZ_HEADER)
+        for u in order:
+            a, b = G.rules[u]
+            x = slots[h[u]]
+            slots[h[u]] += 2
+            if a == 0:
+                out.write(f'\\node[leaf] (n{u}) at ({x},0) {{\\texttt{{{b}}}}};')
+                continue
+            out.write(f'\\node[{node_styles[u]}] (n{u}) at ({x},{h[u]}) {{{u}}};')
+            for c, label in children(G, u):
+                text = '' if label is None else f' node[midway, fill=white] {{${label}$}}'
+                out.write(f'\\draw[{edge_styles[(u, c)]}] (n{u}) --{text} (n{c});')
+        out.write(TIKZ_FOOTER)
+    else:
+        raise ValueError(f'Unknown format {fmt}')
+
+
+def write_derivation_tree(G, out, fmt='tikz', max_depth=None, max_nodes=None):
+    """
+    Writes the derivation tree of G, streaming it to out (any object with write).
+    The tree is cut at max_depth levels below the root and after max_nodes
+    drawn nodes; a cut subtree is drawn as a leaf labelled with its nonterminal
+    and expansion length, and once the budget is spent the children still
+    pending below a node are drawn as one leaf "+count:length". A run rule b^k
+    has the single child b labelled ^k, as in write_dag. Leaves get unit width,
+    so an uncut tree without run rules is laid out exactly at the text
+    positions. Returns the height of the drawn tree.
+    """
+    if fmt not in ('tikz', 'dot'):
+        raise ValueError(f'Unknown format {fmt}')
+    if fmt == 'tikz':
+        out.write(TIKZ_HEADER)
+    else:
+        out.write('digraph G {\nordering=out;\nnode [shape=circle];\n')
+
+    next_id = 0
+    next_leaf = 0 # x position of the next leaf
+    # frame: [node id, nonterminal, tree depth, pending (child, edge label, rc), drawn (child id, child nonterminal, edge label),
+    #         height, cut label (None if not cut), x of the cut after the first child, rc]
+    # rc: the frame stands for rc(Exp(u)), so binary children are swapped and leaves complemented (as in SLP.extract)
+    stack = []
+
+    def budget_spent():
+        return max_nodes is not None and next_id >= max_nodes
+
+    def push(u, depth, rc):
+        nonlocal next_id
+        cut = (max_depth is not None and depth >= max_depth) or budget_spent()
+        a, b = G.rules[u]
+        pending = []
+        if not cut:
+            if a is None: # reverse complement
+                pending = [(b, 'rc', not rc)]
+            elif a is not None and a > 0: # binary; rc(a b) = rc(b) rc(a)
+                pending = [(b, None, rc), (a, None, rc)] if rc else [(a, None, rc), (b, None, rc)]
+            elif a is not None and a < 0: # run rule: one child labelled with the exponent
+                pending = [(b, f'^{-a}', rc)]
+        label = f'{"rc " if rc else ""}{u}:{G.length(u)}' if cut and a != 0 else None
+        stack.append([next_id, u, depth, list(reversed(pending)), [], 0, label, None, rc])
+        next_id += 1
+
+    def push_skipped(skipped, depth): # a single leaf for the children left out when the budget is spent
+        nonlocal next_id
+        label = f'+{len(skipped)}:{sum(G.length(c) for c, _, _ in skipped)}'
+        stack.append([next_id, None, depth, [], [], 0, label, None, False])
+        next_id += 1
+
+    def edge_label(label): # TikZ label of an edge
+        return '' if label is None else f' node[midway, fill=white] {{${label}$}}'
+
+    push(G.start, 0, False)
+    result = 0
+    while stack:
+        frame = stack[-1]
+        if frame[3] and budget_spent():
+            skipped, frame[3] = frame[3], []
+            frame[4].append((next_id, None, None))
+            push_skipped(skipped, frame[2] + 1)
+            continue
+        if frame[3]:
+            c, label, rc = frame[3].pop()
+            frame[4].append((next_id, c, label))
+            push(c, frame[2] + 1, rc)
+            continue
+        stack.pop()
+        id, u, depth, _, drawn, height, cut, mid, rc = frame
+        if not drawn:
+            x = next_leaf + 0.5
+            next_leaf += 1
+            if cut is not None:
+                label = cut
+                if fmt == 'tikz':
+                    out.write(f'\\node[leaf] ({id}) at ({x},0) {{$\\triangle_{{{label}}}$}};')
+                else:
+                    out.write(f'{id} [label={dot_quote(label)}, shape=triangle];\n')
+            else:
+                b = G.rules[u][1]
+                if rc: b = COMPLEMENT[b]
+                if fmt == 'tikz':
+                    out.write(f'\\node[leaf] ({id}) at ({x},0) {{\\texttt{{{b}}}}};')
+                else:
+                    out.write(f'{id} [label={dot_quote(b)}, shape=plaintext];\n')
+        else:
+            if fmt == 'tikz':
+                out.write(f'\\node[{node_styles[u]}] ({id}) at ({mid},{height}) {{{u}}};')
+            else:
+                out.write(f'{id} [label="{u}"{dot_color(node_styles[u])}];\n')
+            for c_id, c, label in drawn:
+                if fmt == 'tikz':
+                    out.write(f'\\draw[{edge_styles[(u, c)]}] ({id}) --{edge_label(label)} ({c_id});')
+                else:
+                    out.write(dot_edge(id, c_id, edge_styles[(u, c)], label))
+        if stack:
+            parent = stack[-1]
+            parent[5] = max(parent[5], height + 1)
+            if parent[7] is None: # the first child is done: the parent is drawn above this cut
+                parent[7] = next_leaf
+        else:
+            result = height
+
+    out.write(TIKZ_FOOTER if fmt == 'tikz' else '}\n')
+    return result
 
 
 def show_longest_path(G):
@@ -72,13 +249,14 @@ def show_heavy_paths(G):
             edge_styles[(P[i], R[i])] = 'light edge, blue'
     
 
-def draw_derivation_tree(G):
-    global res
-    depth, root_id = dfs(G)
-    assert depth == G.depth()
-    # res += f'\\node[align=left, anchor=west] at ({0},{depth}) {{depth: ${depth}$ \\\\ size: ${G.size()}$}};'
-    res += '\\end{tikzpicture}\n\\end{document}'
-    print(res)
+def draw_derivation_tree(G, out=sys.stdout, fmt='tikz', max_depth=None, max_nodes=None):
+    depth = write_derivation_tree(G, out, fmt, max_depth, max_nodes)
+    if max_depth is None and max_nodes is None:
+        assert depth == G.depth()
+
+
+def draw_grammar_dag(G, out=sys.stdout, fmt='dot'):
+    write_dag(G, out, fmt)
 
 
 if __name__ == '__main__':
@@ -93,4 +271,5 @@ if __name__ == '__main__':
     show_heavy_path_balancing(G)
     
     draw_derivation_tree(G)
-    
\ No newline at end of file
+    # draw_derivation_tree(G, max_depth=6)
+    # draw_grammar_dag(G, fmt='dot')